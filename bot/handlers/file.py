@@ -3,6 +3,7 @@ from pyrogram import Client, filters
 from pyrogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton
 from bot.services.files import save_file, format_file_size
 from bot.services.links import generate_file_links
+from bot.services.warmup import schedule_warmup
 from bot.services.users import is_premium
 from config import Config
 
@@ -58,6 +59,10 @@ async def file_handler(client: Client, message: Message):
         )
         return
     
+    # Where the file came from, so the web streamer can refresh an expired file reference
+    file_data["chat_id"] = message.chat.id
+    file_data["message_id"] = message.id
+    
     # Processing message
     processing_msg = await message.reply_text(
         "⏳ **Ruk ja BC, kaam chal raha hai...**\n\n"
@@ -74,6 +79,9 @@ async def file_handler(client: Client, message: Message):
         # Generate links
         links = await generate_file_links(client.db, file_doc, user.id, user_premium)
         
+        # Most links are opened within minutes, so get the file into the streamer cache now
+        schedule_warmup(links["link_token"], links["link_key"])
+        
         # Format file size
         file_size = await format_file_size(file_doc["file_size"])
         
@@ -88,6 +96,10 @@ async def file_handler(client: Client, message: Message):
             f"📥 **DOWNLOAD:**\n`{links['download_link']}`\n\n"
         )
         
+        # HLS playlist only makes sense for MP4 videos
+        if file_doc["mime_type"] in ("video/mp4", "video/quicktime", "video/x-m4v"):
+            response += f"📺 **HLS:**\n`{links['hls_link']}`\n\n"
+        
         if links.get("expiry"):
             response += f"⏰ **Expires:** {links['expiry'].strftime('%d %b %Y, %I:%M %p')}\n\n"
         else:
@@ -1,21 +1,39 @@
 import logging
+from datetime import datetime
 from typing import Optional, Tuple
 from bot.services.tokens import get_token_data, increment_access_count
-from bot.services.security import verify_key
+from bot.services.token_cache import token_cache
+from bot.services.token_filter import token_filter
+from bot.services.security import verify_key, is_signed_token, read_signed_token
+from bot.services.revocations import revoked_links
+from bot.services.access_log import access_log
 
 logger = logging.getLogger(__name__)
 
-async def verify_access(db, token: str, key: str) -> Tuple[bool, Optional[dict], str]:
+async def verify_access(db, token: str, key: str, count_access: bool = True) -> Tuple[bool, Optional[dict], str]:
     """
     Verify if user has access to file
+    count_access: False for internal requests (e.g. cache warm-up) that aren't views
     Returns: (success, token_data, error_message)
     """
     try:
-        # Get token data
-        token_data = await get_token_data(db, token)
+        if is_signed_token(token):
+            return await verify_signed_access(db, token, key, count_access)
+        
+        # Get token data (repeat requests on a link are answered from memory)
+        token_data = token_cache.get(token)
         
         if not token_data:
-            return False, None, "invalid_token"
+            # Tokens no link ever had (scanners) are turned away before the database
+            if not token_filter.might_exist(token):
+                return False, None, "invalid_token"
+            
+            token_data = await get_token_data(db, token)
+            
+            if not token_data:
+                return False, None, "invalid_token"
+            
+            token_cache.put(token_data)
         
         # Verify key
         is_valid = verify_key(token, token_data["file_id"], key)
@@ -25,7 +43,8 @@ async def verify_access(db, token: str, key: str) -> Tuple[bool, Optional[dict],
             return False, None, "invalid_key"
         
         # Increment access count
-        await increment_access_count(db, token)
+        if count_access:
+            await increment_access_count(db, token)
         
         logger.info(f"✅ Access granted for token: {token}")
         return True, token_data, None
@@ -34,6 +53,29 @@ async def verify_access(db, token: str, key: str) -> Tuple[bool, Optional[dict],
         logger.error(f"❌ Access verification failed BC: {e}")
         return False, None, "server_error"
 
+async def verify_signed_access(db, token: str, key: str, count_access: bool = True) -> Tuple[bool, Optional[dict], str]:
+    """
+    Verify a signed link token: one HMAC check, no database lookup
+    Returns: (success, token_data, error_message)
+    """
+    token_data = read_signed_token(token, key)
+    
+    if not token_data:
+        logger.warning(f"⚠️ Invalid signed token attempt: {token[:20]}...")
+        return False, None, "invalid_key"
+    
+    if token_data["expiry_at"] and token_data["expiry_at"] < datetime.utcnow():
+        return False, None, "expired"
+    
+    if revoked_links.is_revoked(token_data):
+        return False, None, "invalid_token"
+    
+    # Counted against the link's short token, like legacy links
+    if count_access:
+        await increment_access_count(db, token_data["token"])
+    
+    return True, token_data, None
+
 async def check_rate_limit(db, user_id: int, limit: int = 10, window_minutes: int = 60) -> bool:
     """
     Check if user has exceeded rate limit
@@ -61,19 +103,18 @@ async def check_rate_limit(db, user_id: int, limit: int = 10, window_minutes: in
         logger.error(f"❌ Rate limit check failed: {e}")
         return True  # Allow on error
 
-async def log_access_attempt(db, token: str, user_id: int, ip_address: str, success: bool, error: str = None):
-    """Log access attempt for security monitoring"""
+async def log_access_attempt(db, token: str, user_id: int, ip_address: str, success: bool, error: str = None, latency_ms: float = None):
+    """Log access attempt for security monitoring (queued, written in batches)"""
     try:
-        log_doc = {
+        access_log.log({
+            "kind": "verify",
             "token": token,
             "user_id": user_id,
             "ip_address": ip_address,
             "success": success,
             "error": error,
-            "timestamp": datetime.utcnow()
-        }
-        
-        await db.access_logs.insert_one(log_doc)
+            "latency_ms": latency_ms
+        })
     
     except Exception as e:
         logger.error(f"❌ Failed to log access attempt: {e}")
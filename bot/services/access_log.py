@@ -0,0 +1,134 @@
+import asyncio
+import logging
+import random
+from datetime import datetime
+from pymongo.errors import CollectionInvalid, OperationFailure
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+ACCESS_LOG_COLLECTION = "access_logs"
+NAMESPACE_EXISTS = 48  # server error code when the collection is already there
+
+class AccessLogPipeline:
+    """
+    Bounded queue of access events written in batches with insert_many
+    Logging never waits: past ACCESS_LOG_SAMPLE_ABOVE of the queue, successful
+    events are sampled (kept ones carry a weight so totals can be estimated),
+    and once the queue is full new events are dropped and counted
+    """
+    
+    def __init__(self):
+        self.queue = asyncio.Queue(maxsize=Config.ACCESS_LOG_QUEUE)
+        self.db = None
+        self.writer_task = None
+        self.writing = None  # insert_many in progress, finished even if the writer is cancelled
+        self.written = 0
+        self.dropped = 0
+        self.sampled_out = 0
+    
+    async def start(self, db):
+        """Make sure the capped collection exists and start the writer"""
+        if self.writer_task is not None or not Config.ACCESS_LOG:
+            return
+        
+        self.db = db
+        
+        try:
+            await db.create_collection(ACCESS_LOG_COLLECTION, capped=True, size=Config.ACCESS_LOG_MAX_BYTES)
+            logger.info(f"✅ Created capped {ACCESS_LOG_COLLECTION} collection")
+        except CollectionInvalid:
+            pass  # Already there
+        except OperationFailure as e:
+            # Another process (bot or a web worker) created it first
+            if e.code != NAMESPACE_EXISTS and "already exists" not in str(e):
+                raise
+        
+        self.writer_task = asyncio.create_task(self._write_loop())
+    
+    async def stop(self):
+        """Stop the writer and write what is still queued"""
+        if self.writer_task is None:
+            return
+        
+        self.writer_task.cancel()
+        self.writer_task = None
+        await asyncio.sleep(0)
+        
+        if self.writing:
+            await asyncio.wait([self.writing])
+        
+        while not self.queue.empty():
+            await self._write(self._take(Config.ACCESS_LOG_BATCH))
+    
+    def log(self, event: dict):
+        """Queue one event; never blocks"""
+        if self.writer_task is None:
+            return
+        
+        weight = 1.0
+        fill = self.queue.qsize() / max(1, self.queue.maxsize)
+        threshold = Config.ACCESS_LOG_SAMPLE_ABOVE
+        
+        # Failures are what audits look for, so only successes are thinned out
+        if fill >= threshold and event.get("success", True):
+            keep = max(0.0, (1 - fill) / (1 - threshold)) if threshold < 1 else 0.0
+            
+            if random.random() >= keep:
+                self.sampled_out += 1
+                return
+            
+            weight = 1 / keep
+        
+        event["weight"] = weight
+        event.setdefault("timestamp", datetime.utcnow())
+        
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.dropped += 1
+    
+    def stats(self) -> dict:
+        return {
+            "queued": self.queue.qsize(),
+            "written": self.written,
+            "dropped": self.dropped,
+            "sampled_out": self.sampled_out
+        }
+    
+    def _take(self, limit: int) -> list:
+        batch = []
+        
+        while len(batch) < limit and not self.queue.empty():
+            batch.append(self.queue.get_nowait())
+        
+        return batch
+    
+    async def _write_loop(self):
+        while True:
+            # Wait for the first event, then give the batch a moment to fill up
+            batch = [await self.queue.get()]
+            
+            try:
+                if self.queue.qsize() < Config.ACCESS_LOG_BATCH:
+                    await asyncio.sleep(Config.ACCESS_LOG_FLUSH_INTERVAL)
+            finally:
+                # Runs on shutdown too, so events already taken off the queue still get written
+                batch += self._take(Config.ACCESS_LOG_BATCH - 1)
+                self.writing = asyncio.create_task(self._write(batch))
+            
+            await asyncio.shield(self.writing)
+    
+    async def _write(self, batch: list):
+        if not batch:
+            return
+        
+        try:
+            await self.db[ACCESS_LOG_COLLECTION].insert_many(batch, ordered=False)
+            self.written += len(batch)
+        except Exception as e:
+            self.dropped += len(batch)
+            logger.error(f"❌ Failed to write {len(batch)} access log events: {e}")
+
+# Global access log pipeline instance
+access_log = AccessLogPipeline()
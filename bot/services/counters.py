@@ -0,0 +1,86 @@
+import asyncio
+import logging
+from datetime import datetime
+from pymongo import UpdateOne
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+class AccessCounterBuffer:
+    """
+    Write-behind buffer for link access counters
+    Increments and last_accessed are combined per token in memory and written
+    with one unordered bulk_write every ACCESS_FLUSH_INTERVAL seconds, or sooner
+    once ACCESS_FLUSH_MAX_TOKENS tokens are waiting
+    """
+    
+    def __init__(self):
+        self.pending = {}  # token -> {"count": n, "last_accessed": datetime}
+        self.db = None
+        self.flush_task = None
+        self.writing = None  # bulk_write in progress, finished even if the flusher is cancelled
+        self.full = asyncio.Event()
+    
+    def add(self, db, token: str):
+        """Count one access (written to the database later)"""
+        self.db = db
+        entry = self.pending.setdefault(token, {"count": 0, "last_accessed": None})
+        entry["count"] += 1
+        entry["last_accessed"] = datetime.utcnow()
+        
+        if self.flush_task is None:
+            self.flush_task = asyncio.create_task(self._flush_loop())
+        
+        if len(self.pending) >= Config.ACCESS_FLUSH_MAX_TOKENS:
+            self.full.set()
+    
+    async def stop(self):
+        """Stop the flusher and write whatever is still buffered"""
+        if self.flush_task:
+            self.flush_task.cancel()
+            self.flush_task = None
+        
+        if self.writing:
+            await asyncio.wait([self.writing])
+        
+        await self.flush()
+    
+    async def flush(self):
+        if not self.pending or self.db is None:
+            return
+        
+        batch, self.pending = self.pending, {}
+        self.full.clear()
+        
+        operations = [
+            UpdateOne(
+                {"token": token},
+                {
+                    "$inc": {"access_count": entry["count"]},
+                    "$max": {"last_accessed": entry["last_accessed"]}
+                }
+            )
+            for token, entry in batch.items()
+        ]
+        
+        self.writing = asyncio.create_task(self._write(operations))
+        await asyncio.shield(self.writing)
+    
+    async def _write(self, operations: list):
+        try:
+            await self.db.links.bulk_write(operations, ordered=False)
+        except Exception as e:
+            # Counters are best effort; a failed batch is logged and dropped
+            logger.error(f"❌ Failed to flush {len(operations)} access counters: {e}")
+    
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self.full.wait(), Config.ACCESS_FLUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            
+            await self.flush()
+
+# Global access counter buffer instance
+access_counters = AccessCounterBuffer()
@@ -1,6 +1,7 @@
 import logging
 from motor.motor_asyncio import AsyncIOMotorClient
 from config import Config
+from bot.services.revocations import REVOCATION_RETENTION
 
 logger = logging.getLogger(__name__)
 
@@ -20,7 +21,11 @@ class Database:
             await self.db.files.create_index("file_unique_id", unique=True)
             await self.db.links.create_index("token", unique=True)
             await self.db.links.create_index("file_id")
+            await self.db.links.create_index("created_at")
             await self.db.links.create_index([("expiry_at", 1)], expireAfterSeconds=0)
+            await self.db.media_index.create_index("file_unique_id", unique=True)
+            await self.db.revocations.create_index([("revoked_at", 1)], expireAfterSeconds=REVOCATION_RETENTION)
+            await self.db.revoked_links.create_index([("expiry_at", 1)], expireAfterSeconds=0)
             
             logger.info("✅ MongoDB connected BC!")
             return self.db
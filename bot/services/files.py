@@ -1,6 +1,7 @@
 import logging
 from datetime import datetime
 from typing import Optional
+from bot.services.revocations import record_revocation, latest_expiry
 
 logger = logging.getLogger(__name__)
 
@@ -14,12 +15,15 @@ async def save_file(db, file_data: dict) -> dict:
             "file_size": file_data.get("file_size", 0),
             "mime_type": file_data.get("mime_type", "application/octet-stream"),
             "uploader_id": file_data["uploader_id"],
+            "chat_id": file_data.get("chat_id"),
+            "message_id": file_data.get("message_id"),
             "upload_time": datetime.utcnow(),
         }
         
+        # A fresh upload carries a fresh reference, so a refreshed one is stale now
         result = await db.files.update_one(
             {"file_unique_id": file_doc["file_unique_id"]},
-            {"$set": file_doc},
+            {"$set": file_doc, "$unset": {"current_file_id": ""}},
             upsert=True
         )
         
@@ -43,6 +47,26 @@ async def get_file_by_id(db, file_id: str) -> Optional[dict]:
         logger.error(f"❌ File lookup failed: {e}")
         return None
 
+async def save_current_file_id(db, file_unique_id: str, current_file_id: str):
+    """Remember the file_id carrying a refreshed file reference, for every worker and restart"""
+    await db.files.update_one(
+        {"file_unique_id": file_unique_id},
+        {"$set": {"current_file_id": current_file_id}}
+    )
+
+async def choose_stream_layout(db, file_unique_id: str, choice: str) -> str:
+    """
+    Record how a file is streamed ("raw" or "faststart") unless that is already decided
+    Returns the choice on record, which every request from then on follows
+    """
+    await db.files.update_one(
+        {"file_unique_id": file_unique_id, "stream_layout": {"$exists": False}},
+        {"$set": {"stream_layout": choice}}
+    )
+    
+    file_doc = await db.files.find_one({"file_unique_id": file_unique_id}, {"stream_layout": 1})
+    return (file_doc or {}).get("stream_layout") or choice
+
 async def get_file_by_unique_id(db, file_unique_id: str) -> Optional[dict]:
     """Get file by Telegram file_unique_id"""
     try:
@@ -66,12 +90,20 @@ async def delete_file(db, file_id: str, user_id: int) -> bool:
             logger.warning(f"⚠️ Unauthorized delete attempt by user {user_id}")
             return False
         
+        # Revoke every link of the file first; nothing is deleted unless that is on record.
+        # Web servers drop their cached copies when they poll the revocations feed.
+        await record_revocation(db, file_id=file_id, expiry_at=await latest_expiry(db, {"file_id": file_id}))
+        
         # Delete file
         await db.files.delete_one({"file_id": file_id})
         
         # Delete all associated links
         result = await db.links.delete_many({"file_id": file_id})
         
+        # Delete the media index
+        from bot.services.media import delete_media_index
+        await delete_media_index(db, file_doc["file_unique_id"])
+        
         logger.info(f"🗑 File deleted: {file_id[:10]}... with {result.deleted_count} links")
         return True
     
@@ -2,7 +2,8 @@ import logging
 from typing import Optional
 from config import Config
 from bot.services.tokens import create_file_token
-from bot.services.security import create_secure_link
+from bot.services.security import create_secure_link, sign_link_token
+from bot.services.revocations import record_revocation
 
 logger = logging.getLogger(__name__)
 
@@ -21,17 +22,28 @@ async def generate_file_links(db, file_doc: dict, user_id: int, is_premium: bool
         token = token_data["token"]
         key = token_data["key"]
         
+        # Web links carry a signed token the server can check without a lookup;
+        # the short token stays the link's id for the bot (deep links, buttons)
+        link_token, link_key = token, key
+        
+        if Config.SIGNED_LINKS:
+            link_token, link_key = sign_link_token(token, token_data["file_id"], token_data.get("expiry_at"), is_premium)
+        
         # Generate links
         telegram_link = f"https://t.me/{Config.BOT_USERNAME}?start={token}"
-        stream_link = create_secure_link(token, key, "stream")
-        download_link = create_secure_link(token, key, "download")
+        stream_link = create_secure_link(link_token, link_key, "stream")
+        download_link = create_secure_link(link_token, link_key, "download")
+        hls_link = f"{Config.WEB_BASE_URL}/hls/{link_token}/index.m3u8?key={link_key}"
         
         links = {
             "token": token,
             "key": key,
+            "link_token": link_token,
+            "link_key": link_key,
             "telegram_link": telegram_link,
             "stream_link": stream_link,
             "download_link": download_link,
+            "hls_link": hls_link,
             "is_premium": is_premium,
             "expiry": token_data.get("expiry_at")
         }
@@ -84,6 +96,11 @@ async def delete_link(db, token: str, user_id: int) -> bool:
             logger.warning(f"⚠️ Unauthorized link delete by user {user_id}")
             return False
         
+        # Revoke first: a signed token outlives its links document, so the link
+        # is only deleted once the revocation is on record. Web servers drop their
+        # cached copy when they poll the revocations feed.
+        await record_revocation(db, token=token, expiry_at=link.get("expiry_at"))
+        
         # Delete
         result = await db.links.delete_one({"token": token})
         
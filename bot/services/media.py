@@ -0,0 +1,36 @@
+import logging
+from datetime import datetime
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+async def save_media_index(db, index_doc: dict):
+    """Save the parsed container layout of a file"""
+    try:
+        index_doc["indexed_at"] = datetime.utcnow()
+        
+        await db.media_index.update_one(
+            {"file_unique_id": index_doc["file_unique_id"]},
+            {"$set": index_doc},
+            upsert=True
+        )
+        
+        logger.info(f"✅ Media index saved for {index_doc['file_unique_id']}")
+    
+    except Exception as e:
+        logger.error(f"❌ Media index save failed BC: {e}")
+
+async def get_media_index(db, file_unique_id: str) -> Optional[dict]:
+    """Get the parsed container layout of a file"""
+    try:
+        return await db.media_index.find_one({"file_unique_id": file_unique_id})
+    except Exception as e:
+        logger.error(f"❌ Media index lookup failed: {e}")
+        return None
+
+async def delete_media_index(db, file_unique_id: str):
+    """Delete the parsed container layout of a file"""
+    try:
+        await db.media_index.delete_one({"file_unique_id": file_unique_id})
+    except Exception as e:
+        logger.error(f"❌ Media index deletion failed: {e}")
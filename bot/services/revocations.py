@@ -0,0 +1,81 @@
+import logging
+from datetime import datetime
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Deleted links and files are announced in "revocations" so other processes can
+# drop cached copies; entries expire after a day through a TTL index.
+# Signed link tokens stay valid without their links document, so they are also
+# kept in "revoked_links" until the link would have expired anyway.
+REVOCATION_RETENTION = 24 * 60 * 60  # seconds
+
+async def record_revocation(db, token: Optional[str] = None, file_id: Optional[str] = None, expiry_at: Optional[datetime] = None):
+    """
+    Announce that a link (token) or every link of a file (file_id) is gone
+    expiry_at: when the link would have expired (None = never)
+    Errors propagate: callers record the revocation before deleting, so a failure
+    here must stop the delete rather than leave a signed token working
+    """
+    await db.revoked_links.insert_one({
+        "token": token,
+        "file_id": file_id,
+        "expiry_at": expiry_at
+    })
+    
+    await db.revocations.insert_one({
+        "token": token,
+        "file_id": file_id,
+        "revoked_at": datetime.utcnow()
+    })
+
+async def latest_expiry(db, query: dict) -> Optional[datetime]:
+    """
+    When the last matching link would have expired, so its revocation can expire too
+    None if any of them never expires; now when none are left
+    """
+    latest = datetime.utcnow()
+    
+    async for link in db.links.find(query, {"expiry_at": 1}):
+        if not link.get("expiry_at"):
+            return None
+        
+        latest = max(latest, link["expiry_at"])
+    
+    return latest
+
+async def get_revocations_since(db, since: datetime) -> list:
+    """Revocations recorded after a point in time, oldest first"""
+    cursor = db.revocations.find({"revoked_at": {"$gt": since}}).sort("revoked_at", 1)
+    return await cursor.to_list(length=None)
+
+class RevokedLinks:
+    """
+    Compact in-memory set of deleted links that signed tokens must not reach
+    Loaded once at startup, then kept current from the revocation feed
+    """
+    
+    def __init__(self):
+        self.tokens = set()
+        self.file_ids = set()
+    
+    async def load(self, db):
+        cursor = db.revoked_links.find({}, {"token": 1, "file_id": 1, "_id": 0})
+        
+        async for doc in cursor:
+            self.add(doc.get("token"), doc.get("file_id"))
+        
+        logger.info(f"✅ Loaded {len(self.tokens) + len(self.file_ids)} revoked links")
+    
+    def add(self, token: Optional[str] = None, file_id: Optional[str] = None):
+        if token:
+            self.tokens.add(token)
+        
+        if file_id:
+            self.file_ids.add(file_id)
+    
+    def is_revoked(self, token_data: dict) -> bool:
+        return token_data["token"] in self.tokens or token_data["file_id"] in self.file_ids
+
+# Global revoked links instance
+revoked_links = RevokedLinks()
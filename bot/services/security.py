@@ -2,8 +2,18 @@ import hashlib
 import hmac
 import secrets
 import base64
+import struct
+from datetime import datetime
 from config import Config
-from typing import Tuple
+from typing import Optional, Tuple
+
+# Signed link tokens carry everything needed to authorize a request:
+#   "v1." + base64url(version | flags | expiry | link token | file_id)
+# and the key is an HMAC of that string, so no database lookup is needed
+SIGNED_TOKEN_PREFIX = "v1."
+SIGNED_TOKEN_VERSION = 1
+SIGNED_HEADER = struct.Struct(">BBIB")  # version, flags, expiry (unix seconds, 0 = never), link token length
+FLAG_PREMIUM = 1
 
 def generate_token() -> str:
     """Generate random secure token"""
@@ -26,6 +36,58 @@ def verify_key(token: str, file_id: str, provided_key: str) -> bool:
     expected_key = generate_key(token, file_id)
     return hmac.compare_digest(expected_key, provided_key)
 
+def is_signed_token(token: str) -> bool:
+    """Legacy tokens are plain token_urlsafe strings and never contain a dot"""
+    return token.startswith(SIGNED_TOKEN_PREFIX)
+
+def sign_link_token(token: str, file_id: str, expiry_at: Optional[datetime], is_premium: bool) -> Tuple[str, str]:
+    """
+    Build a self-contained link token for an existing link
+    Returns: (signed_token, key)
+    """
+    expiry = int((expiry_at - datetime(1970, 1, 1)).total_seconds()) if expiry_at else 0
+    flags = FLAG_PREMIUM if is_premium else 0
+    token_bytes = token.encode()
+    
+    payload = SIGNED_HEADER.pack(SIGNED_TOKEN_VERSION, flags, expiry, len(token_bytes)) + token_bytes + file_id.encode()
+    signed_token = SIGNED_TOKEN_PREFIX + base64.urlsafe_b64encode(payload).decode().rstrip("=")
+    
+    return signed_token, _signed_key(signed_token)
+
+def read_signed_token(signed_token: str, provided_key: str) -> Optional[dict]:
+    """
+    Check a signed token's key and unpack it
+    Returns: token data shaped like a links document, or None if forged or malformed
+    """
+    if not hmac.compare_digest(_signed_key(signed_token), provided_key or ""):
+        return None
+    
+    try:
+        encoded = signed_token[len(SIGNED_TOKEN_PREFIX):]
+        payload = base64.urlsafe_b64decode(encoded + "=" * (-len(encoded) % 4))
+        version, flags, expiry, token_length = SIGNED_HEADER.unpack_from(payload)
+        
+        if version != SIGNED_TOKEN_VERSION:
+            return None
+        
+        body = payload[SIGNED_HEADER.size:]
+        
+        return {
+            "token": body[:token_length].decode(),
+            "file_id": body[token_length:].decode(),
+            "is_premium": bool(flags & FLAG_PREMIUM),
+            "expiry_at": datetime.utcfromtimestamp(expiry) if expiry else None
+        }
+    except (ValueError, struct.error):
+        return None
+
+def _signed_key(signed_token: str) -> str:
+    return hmac.new(
+        Config.MASTER_SECRET.encode(),
+        f"link:{signed_token}".encode(),
+        hashlib.sha256
+    ).hexdigest()[:32]
+
 def create_secure_link(token: str, key: str, endpoint: str) -> str:
     """Create secure link with token and key"""
     return f"{Config.WEB_BASE_URL}/{endpoint}/{token}?key={key}"
@@ -0,0 +1,117 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Optional
+from config import Config
+from bot.services.revocations import get_revocations_since, revoked_links
+
+logger = logging.getLogger(__name__)
+
+# Revocations are read with this much overlap so clock skew between dynos can't hide one
+REVOCATION_OVERLAP = timedelta(seconds=10)
+
+class TokenCache:
+    """
+    In-process cache of verified link documents, so repeat range requests on a
+    token skip the links lookup
+    Entries live for TOKEN_CACHE_TTL, never past the link's expiry_at, and are
+    dropped as soon as the link or its file is deleted, here or in another process
+    """
+    
+    def __init__(self):
+        self.ttl = Config.TOKEN_CACHE_TTL
+        self.max_entries = Config.TOKEN_CACHE_MAX_ENTRIES
+        self.entries = OrderedDict()  # token -> (token_data, expires_at)
+        self.revoked = {}  # token or file_id -> when it was revoked (monotonic)
+        self.sync_task = None
+    
+    def get(self, token: str) -> Optional[dict]:
+        """Cached link document, or None when missing or stale"""
+        entry = self.entries.get(token)
+        
+        if entry is None:
+            return None
+        
+        token_data, expires_at = entry
+        
+        if time.monotonic() >= expires_at:
+            del self.entries[token]
+            return None
+        
+        self.entries.move_to_end(token)
+        return token_data
+    
+    def put(self, token_data: dict):
+        token = token_data["token"]
+        ttl = self.ttl
+        
+        if ttl <= 0 or self._recently_revoked(token, token_data["file_id"]):
+            return
+        
+        if token_data.get("expiry_at"):
+            ttl = min(ttl, (token_data["expiry_at"] - datetime.utcnow()).total_seconds())
+            
+            if ttl <= 0:
+                return
+        
+        self.entries[token] = (token_data, time.monotonic() + ttl)
+        self.entries.move_to_end(token)
+        
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+    
+    def invalidate(self, token: Optional[str] = None, file_id: Optional[str] = None):
+        """Drop a link, or every link of a file"""
+        now = time.monotonic()
+        
+        if token:
+            self.entries.pop(token, None)
+            self.revoked[token] = now
+        
+        if file_id:
+            for cached, (token_data, _) in list(self.entries.items()):
+                if token_data["file_id"] == file_id:
+                    del self.entries[cached]
+            
+            self.revoked[file_id] = now
+    
+    def _recently_revoked(self, token: str, file_id: str) -> bool:
+        # A lookup that raced a delete must not put the dead link back for a whole TTL
+        cutoff = time.monotonic() - self.ttl
+        
+        for key in [key for key, at in self.revoked.items() if at < cutoff]:
+            del self.revoked[key]
+        
+        return token in self.revoked or file_id in self.revoked
+    
+    def start(self, db):
+        """Follow revocations recorded by other processes (the bot deletes links), also for signed tokens"""
+        if self.sync_task is None:
+            self.sync_task = asyncio.create_task(self._sync_loop(db))
+    
+    async def stop(self):
+        if self.sync_task:
+            self.sync_task.cancel()
+            self.sync_task = None
+    
+    async def _sync_loop(self, db):
+        since = datetime.utcnow()
+        
+        while True:
+            await asyncio.sleep(Config.TOKEN_REVOCATION_POLL)
+            
+            try:
+                revocations = await get_revocations_since(db, since - REVOCATION_OVERLAP)
+            except Exception as e:
+                logger.error(f"❌ Revocation poll failed: {e}")
+                continue
+            
+            for revocation in revocations:
+                self.invalidate(revocation.get("token"), revocation.get("file_id"))
+                revoked_links.add(revocation.get("token"), revocation.get("file_id"))
+                since = max(since, revocation["revoked_at"])
+
+# Global token cache instance
+token_cache = TokenCache()
@@ -0,0 +1,104 @@
+import asyncio
+import hashlib
+import logging
+import math
+from datetime import datetime, timedelta
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# New links are read with this much overlap so clock skew between dynos can't hide one
+CREATION_OVERLAP = timedelta(seconds=10)
+FALSE_POSITIVE_RATE = 0.01
+
+class BloomFilter:
+    """Answers "definitely absent" or "maybe present" in about 10 bits per item"""
+    
+    def __init__(self, capacity: int):
+        self.size = max(64, int(-capacity * math.log(FALSE_POSITIVE_RATE) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+    
+    def _slots(self, item: str) -> list:
+        # Double hashing over one 128-bit digest
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+    
+    def add(self, item: str):
+        for slot in self._slots(item):
+            self.bits[slot >> 3] |= 1 << (slot & 7)
+        
+        self.count += 1
+    
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[slot >> 3] & (1 << (slot & 7)) for slot in self._slots(item))
+
+class TokenFilter:
+    """
+    Shield in front of the links lookup for legacy (unsigned) tokens
+    Holds every live token; a token it has never seen is rejected without a
+    database call, so scanners guessing /stream/<random> never reach Mongo.
+    Built at startup and follows new links. Deleted and expired links stay in
+    until the rebuild every TOKEN_FILTER_REBUILD seconds; until then they only
+    cost the lookup that finds them gone.
+    """
+    
+    def __init__(self):
+        self.filter = None  # None until the first build; everything passes meanwhile
+        self.sync_task = None
+    
+    def might_exist(self, token: str) -> bool:
+        return self.filter is None or token in self.filter
+    
+    def start(self, db):
+        # Only alongside signed links: then new links never need the filter, while
+        # a new legacy link could be refused until the next poll picks it up
+        if self.sync_task is None and Config.TOKEN_FILTER and Config.SIGNED_LINKS:
+            self.sync_task = asyncio.create_task(self._sync_loop(db))
+    
+    async def stop(self):
+        if self.sync_task:
+            self.sync_task.cancel()
+            self.sync_task = None
+    
+    async def _build(self, db) -> datetime:
+        """Load every token into a fresh filter; returns when the load started"""
+        started = datetime.utcnow()
+        capacity = max(Config.TOKEN_FILTER_CAPACITY, await db.links.estimated_document_count() * 2)
+        fresh = BloomFilter(capacity)
+        
+        async for link in db.links.find({}, {"token": 1, "_id": 0}):
+            fresh.add(link["token"])
+        
+        self.filter = fresh
+        logger.info(f"✅ Token filter built with {fresh.count} links")
+        return started
+    
+    async def _sync_loop(self, db):
+        since = None
+        built_at = 0.0
+        loop = asyncio.get_running_loop()
+        
+        while True:
+            try:
+                if since is None or loop.time() - built_at > Config.TOKEN_FILTER_REBUILD:
+                    since = await self._build(db)
+                    built_at = loop.time()
+                
+                else:
+                    cursor = db.links.find({"created_at": {"$gt": since - CREATION_OVERLAP}}, {"token": 1, "created_at": 1})
+                    
+                    async for link in cursor:
+                        self.filter.add(link["token"])
+                        since = max(since, link["created_at"])
+            
+            except Exception as e:
+                logger.error(f"❌ Token filter sync failed: {e}")
+            
+            await asyncio.sleep(Config.TOKEN_REVOCATION_POLL)
+
+# Global token filter instance
+token_filter = TokenFilter()
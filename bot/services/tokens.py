@@ -3,6 +3,8 @@ from datetime import datetime, timedelta
 from typing import Optional
 from config import Config
 from bot.services.security import generate_token, generate_key
+from bot.services.revocations import record_revocation, latest_expiry
+from bot.services.counters import access_counters
 
 logger = logging.getLogger(__name__)
 
@@ -63,21 +65,16 @@ async def get_token_data(db, token: str) -> Optional[dict]:
         return None
 
 async def increment_access_count(db, token: str):
-    """Increment access count for token"""
+    """Increment access count for token (buffered, written in batches)"""
     try:
-        await db.links.update_one(
-            {"token": token},
-            {
-                "$inc": {"access_count": 1},
-                "$set": {"last_accessed": datetime.utcnow()}
-            }
-        )
+        access_counters.add(db, token)
     except Exception as e:
         logger.error(f"❌ Failed to update access count: {e}")
 
 async def delete_token(db, token: str) -> bool:
     """Delete token from database"""
     try:
+        await record_revocation(db, token=token, expiry_at=await latest_expiry(db, {"token": token}))
         result = await db.links.delete_one({"token": token})
         return result.deleted_count > 0
     except Exception as e:
@@ -87,7 +84,9 @@ async def delete_token(db, token: str) -> bool:
 async def delete_all_file_tokens(db, file_id: str) -> int:
     """Delete all tokens for a specific file"""
     try:
+        await record_revocation(db, file_id=file_id, expiry_at=await latest_expiry(db, {"file_id": file_id}))
         result = await db.links.delete_many({"file_id": file_id})
+        
         logger.info(f"🗑 Deleted {result.deleted_count} tokens for file {file_id[:10]}...")
         return result.deleted_count
     except Exception as e:
@@ -0,0 +1,34 @@
+import asyncio
+import logging
+import httpx
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+WARMUP_REQUEST_TIMEOUT = 10  # seconds
+
+# Running warm-up requests, referenced so they aren't garbage collected mid-flight
+pending = set()
+
+async def request_warmup(token: str, key: str):
+    """Ask the web server to cache the start and end of a freshly linked file"""
+    url = f"{Config.WEB_BASE_URL}/warm/{token}"
+    
+    try:
+        async with httpx.AsyncClient(timeout=WARMUP_REQUEST_TIMEOUT) as http:
+            response = await http.post(url, params={"key": key})
+            response.raise_for_status()
+        
+        logger.info(f"🔥 Warm-up requested for token {token[:10]}...")
+    
+    except Exception as e:
+        logger.warning(f"⚠️ Warm-up request failed for token {token[:10]}...: {e}")
+
+def schedule_warmup(token: str, key: str):
+    """Fire and forget: the upload reply never waits on the web server"""
+    if not Config.STREAM_WARMUP:
+        return
+    
+    task = asyncio.create_task(request_warmup(token, key))
+    pending.add(task)
+    task.add_done_callback(pending.discard)
@@ -21,10 +21,70 @@ class Config:
     # Web Server
     WEB_BASE_URL: str = os.environ.get("WEB_BASE_URL", "https://your-app.herokuapp.com")
     PORT: int = int(os.environ.get("PORT", "8080"))
+    WEB_CONCURRENCY: int = int(os.environ.get("WEB_CONCURRENCY", "1"))  # uvicorn workers
+    WEB_RUNTIME_DIR: str = os.environ.get("WEB_RUNTIME_DIR", "run")  # worker lock files
+    WEB_MAX_CONNECTIONS: int = int(os.environ.get("WEB_MAX_CONNECTIONS", "0"))  # across all workers, 0 = no cap
+    FREE_MAX_CONNECTIONS_PER_TOKEN: int = int(os.environ.get("FREE_MAX_CONNECTIONS_PER_TOKEN", "4"))  # per viewer (IP) of a link, 0 = no cap
+    PREMIUM_MAX_CONNECTIONS_PER_TOKEN: int = int(os.environ.get("PREMIUM_MAX_CONNECTIONS_PER_TOKEN", "16"))
+    FREE_MAX_CONNECTIONS_PER_IP: int = int(os.environ.get("FREE_MAX_CONNECTIONS_PER_IP", "8"))
+    PREMIUM_MAX_CONNECTIONS_PER_IP: int = int(os.environ.get("PREMIUM_MAX_CONNECTIONS_PER_IP", "32"))
+    CONNECTION_QUEUE_WAIT: float = float(os.environ.get("CONNECTION_QUEUE_WAIT", "2"))
+    TRUST_PROXY_HEADERS: bool = os.environ.get("TRUST_PROXY_HEADERS", "false").lower() == "true"  # only behind a proxy that appends X-Forwarded-For
+    
+    # Token verification cache (web server)
+    TOKEN_CACHE_TTL: int = int(os.environ.get("TOKEN_CACHE_TTL", "60"))  # seconds, 0 disables
+    TOKEN_CACHE_MAX_ENTRIES: int = int(os.environ.get("TOKEN_CACHE_MAX_ENTRIES", "10000"))
+    TOKEN_FILTER: bool = os.environ.get("TOKEN_FILTER", "true").lower() == "true"  # Bloom filter of live legacy tokens
+    TOKEN_FILTER_CAPACITY: int = int(os.environ.get("TOKEN_FILTER_CAPACITY", "200000"))
+    TOKEN_FILTER_REBUILD: int = int(os.environ.get("TOKEN_FILTER_REBUILD", "21600"))  # seconds
+    TOKEN_REVOCATION_POLL: float = float(os.environ.get("TOKEN_REVOCATION_POLL", "2"))  # seconds
+    ACCESS_FLUSH_INTERVAL: float = float(os.environ.get("ACCESS_FLUSH_INTERVAL", "5"))  # seconds between counter writes
+    ACCESS_FLUSH_MAX_TOKENS: int = int(os.environ.get("ACCESS_FLUSH_MAX_TOKENS", "500"))  # flush early past this many
+    
+    # Signed links are verified without a database lookup; old token links keep working either way
+    SIGNED_LINKS: bool = os.environ.get("SIGNED_LINKS", "true").lower() == "true"
+    
+    # Access log (batched into a capped collection; sampled, then dropped, under backpressure)
+    ACCESS_LOG: bool = os.environ.get("ACCESS_LOG", "true").lower() == "true"
+    ACCESS_LOG_QUEUE: int = int(os.environ.get("ACCESS_LOG_QUEUE", "10000"))  # events buffered per process
+    ACCESS_LOG_BATCH: int = int(os.environ.get("ACCESS_LOG_BATCH", "500"))
+    ACCESS_LOG_FLUSH_INTERVAL: float = float(os.environ.get("ACCESS_LOG_FLUSH_INTERVAL", "2"))  # seconds
+    ACCESS_LOG_SAMPLE_ABOVE: float = float(os.environ.get("ACCESS_LOG_SAMPLE_ABOVE", "0.5"))  # queue fill where sampling starts
+    ACCESS_LOG_MAX_BYTES: int = int(os.environ.get("ACCESS_LOG_MAX_BYTES", str(256 * 1024 * 1024)))  # capped collection size
     
     # Link Expiry (hours)
     FREE_LINK_EXPIRY_HOURS: int = int(os.environ.get("FREE_LINK_EXPIRY_HOURS", "24"))
     
+    # Streaming
+    STREAM_PREFETCH_CHUNKS: int = int(os.environ.get("STREAM_PREFETCH_CHUNKS", "4"))
+    STREAM_PREFETCH_MAX_BYTES: int = int(os.environ.get("STREAM_PREFETCH_MAX_BYTES", str(8 * 1024 * 1024)))
+    STREAM_VIRTUAL_FASTSTART: bool = os.environ.get("STREAM_VIRTUAL_FASTSTART", "true").lower() == "true"
+    STREAM_EGRESS_MAX_RATE: float = float(os.environ.get("STREAM_EGRESS_MAX_RATE", "0"))  # bytes/s, 0 = no cap
+    STREAM_PREMIUM_WEIGHT: float = float(os.environ.get("STREAM_PREMIUM_WEIGHT", "4"))
+    STREAM_FREE_WEIGHT: float = float(os.environ.get("STREAM_FREE_WEIGHT", "1"))
+    HTTP_CACHE_MAX_AGE: int = int(os.environ.get("HTTP_CACHE_MAX_AGE", str(24 * 60 * 60)))
+    HLS_SEGMENT_SECONDS: float = float(os.environ.get("HLS_SEGMENT_SECONDS", "6"))
+    STREAM_SESSIONS: int = int(os.environ.get("STREAM_SESSIONS", "1"))
+    STREAM_POOL_POLICY: str = os.environ.get("STREAM_POOL_POLICY", "least_loaded")  # least_loaded | round_robin
+    STREAM_CLIENT_RATE: float = float(os.environ.get("STREAM_CLIENT_RATE", "20"))  # requests/sec per session
+    STREAM_MAX_WAIT: float = float(os.environ.get("STREAM_MAX_WAIT", "5"))  # seconds before answering 503
+    FETCHER_SOCKET: str = os.environ.get("FETCHER_SOCKET", "")  # e.g. run/fetcher.sock, empty = fetch in-process
+    FETCHER_MAX_IDLE: int = int(os.environ.get("FETCHER_MAX_IDLE", "16"))  # pooled daemon connections per worker
+    STREAM_LOGIN_DELAY: float = float(os.environ.get("STREAM_LOGIN_DELAY", "2"))  # seconds between worker logins
+    
+    # Block Cache (0 disables the disk cache)
+    FILE_LOCATION_TTL: int = int(os.environ.get("FILE_LOCATION_TTL", "3600"))
+    STREAM_CACHE_DIR: str = os.environ.get("STREAM_CACHE_DIR", "cache/blocks")
+    STREAM_CACHE_MAX_BYTES: int = int(os.environ.get("STREAM_CACHE_MAX_BYTES", str(2 * 1024 * 1024 * 1024)))
+    STREAM_MEMORY_CACHE_MAX_BYTES: int = int(os.environ.get("STREAM_MEMORY_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+    
+    # Cache warm-up for new uploads (runs only while no viewer is fetching)
+    STREAM_WARMUP: bool = os.environ.get("STREAM_WARMUP", "true").lower() == "true"
+    STREAM_WARMUP_HEAD_BYTES: int = int(os.environ.get("STREAM_WARMUP_HEAD_BYTES", str(4 * 1024 * 1024)))
+    STREAM_WARMUP_TAIL_BYTES: int = int(os.environ.get("STREAM_WARMUP_TAIL_BYTES", str(4 * 1024 * 1024)))
+    STREAM_WARMUP_QUEUE: int = int(os.environ.get("STREAM_WARMUP_QUEUE", "64"))  # pending files per process
+    STREAM_WARMUP_MAX_DELAY: float = float(os.environ.get("STREAM_WARMUP_MAX_DELAY", "600"))  # seconds before a job is dropped
+    
     # Wait Time (seconds)
     FREE_USER_WAIT_TIME: int = int(os.environ.get("FREE_USER_WAIT_TIME", "15"))
     
@@ -1,12 +1,23 @@
 import logging
 from fastapi import FastAPI, Request, HTTPException
-from fastapi.responses import HTMLResponse, FileResponse
+from fastapi.responses import HTMLResponse, FileResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 from config import Config
-from web.middleware import verify_request, handle_error, get_db
-from web.stream import stream_file, init_stream_client, cleanup_stream_client
+from web.middleware import verify_request, handle_error, get_db, limit_connection, TooManyConnections
+from web.stream import stream_file, init_stream_client, cleanup_stream_client, stream_stats
+from web.governor import StreamUnavailable
+from web.indexer import schedule_index, ensure_index
+from web.faststart import get_virtual_layout, layout_settled
+from web.hls import get_hls_presentation, render_playlist
+from web.conditional import cache_control, is_revalidation
+from web.ranges import starts_playback
 from bot.services.files import get_file_by_id
+from bot.services.token_cache import token_cache
+from bot.services.revocations import revoked_links
+from bot.services.token_filter import token_filter
+from bot.services.access_log import access_log
+from bot.services.counters import access_counters
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -17,12 +28,20 @@ async def lifespan(app: FastAPI):
     # Startup
     logger.info("🚀 Starting web server BC...")
     await init_stream_client()
+    await revoked_links.load(await get_db())
+    token_cache.start(await get_db())
+    token_filter.start(await get_db())
+    await access_log.start(await get_db())
     logger.info("✅ Web server ready! 🔥")
     
     yield
     
     # Shutdown
     logger.info("🛑 Shutting down web server...")
+    await token_cache.stop()
+    await token_filter.stop()
+    await access_counters.stop()
+    await access_log.stop()
     await cleanup_stream_client()
 
 # Create FastAPI app
@@ -105,7 +124,7 @@ async def root():
     """
     return HTMLResponse(content=html)
 
-@app.get("/stream/{token}")
+@app.api_route("/stream/{token}", methods=["GET", "HEAD"])
 async def stream_endpoint(token: str, key: str, request: Request):
     """Stream file endpoint"""
     try:
@@ -122,14 +141,53 @@ async def stream_endpoint(token: str, key: str, request: Request):
         if not file_doc:
             return await handle_error("file_not_found")
         
+        # HEAD probes and revalidations never start Telegram reads
+        opening = request.method == "GET" and not is_revalidation(request.headers)
+        
+        # Serve moov-at-end MP4s with moov moved to the front. The request that starts
+        # playback waits briefly for the index and settles the layout for good, so a
+        # viewer's first and later requests (in any worker) see the same bytes.
+        layout = None
+        final = True
+        
+        if Config.STREAM_VIRTUAL_FASTSTART:
+            decide = opening and starts_playback(request.headers.get("range"))
+            
+            if decide and "stream_layout" not in file_doc:
+                await ensure_index(db, file_doc, Config.STREAM_MAX_WAIT)
+            
+            layout = await get_virtual_layout(db, await init_stream_client(), file_doc, decide)
+            final = layout_settled(file_doc)
+        
+        # Index in the background otherwise (HLS playlists need it too)
+        if opening:
+            schedule_index(db, file_doc)
+        
         # Stream file
-        return await stream_file(file_doc["file_id"], request)
+        lease = await limit_connection(request, token, token_data)
+        return await stream_file(file_doc, request, layout, token_data, lease, final)
+    
+    except TooManyConnections as e:
+        logger.warning(f"⚠️ Stream endpoint over connection cap: {e}")
+        return await handle_error(
+            "too_many_connections",
+            status_code=429,
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    
+    except StreamUnavailable as e:
+        logger.warning(f"⚠️ Stream endpoint busy: {e}")
+        return await handle_error(
+            "server_busy",
+            status_code=503,
+            headers={"Retry-After": str(e.retry_after)}
+        )
     
     except Exception as e:
         logger.error(f"❌ Stream endpoint failed BC: {e}")
         return await handle_error("server_error")
 
-@app.get("/download/{token}")
+@app.api_route("/download/{token}", methods=["GET", "HEAD"])
 async def download_endpoint(token: str, key: str, request: Request):
     """Download file endpoint"""
     try:
@@ -152,7 +210,8 @@ async def download_endpoint(token: str, key: str, request: Request):
         }
         
         # Stream file with download header
-        response = await stream_file(file_doc["file_id"], request)
+        lease = await limit_connection(request, token, token_data)
+        response = await stream_file(file_doc, request, token_data=token_data, lease=lease)
         
         # Update headers
         for key, value in headers.items():
@@ -160,17 +219,151 @@ async def download_endpoint(token: str, key: str, request: Request):
         
         return response
     
+    except TooManyConnections as e:
+        logger.warning(f"⚠️ Download endpoint over connection cap: {e}")
+        return await handle_error(
+            "too_many_connections",
+            status_code=429,
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    
+    except StreamUnavailable as e:
+        logger.warning(f"⚠️ Download endpoint busy: {e}")
+        return await handle_error(
+            "server_busy",
+            status_code=503,
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    
     except Exception as e:
         logger.error(f"❌ Download endpoint failed BC: {e}")
         return await handle_error("server_error")
 
+@app.get("/hls/{token}/index.m3u8")
+async def hls_playlist_endpoint(token: str, key: str, request: Request):
+    """HLS playlist with byte-range segments cut at keyframes"""
+    try:
+        # Verify access
+        success, token_data, error = await verify_request(request, token, key)
+        
+        if not success:
+            return await handle_error(error)
+        
+        # Get file
+        db = await get_db()
+        file_doc = await get_file_by_id(db, token_data["file_id"])
+        
+        if not file_doc:
+            return await handle_error("file_not_found")
+        
+        await ensure_index(db, file_doc, Config.STREAM_MAX_WAIT)
+        presentation = await get_hls_presentation(db, await init_stream_client(), file_doc)
+        
+        if not presentation:
+            return await handle_error("hls_unavailable", status_code=404)
+        
+        # Segments are byte ranges of media.mp4 next to this playlist
+        return Response(
+            content=render_playlist(presentation, f"media.mp4?key={key}"),
+            media_type="application/vnd.apple.mpegurl",
+            headers={"Cache-Control": cache_control(token_data)}
+        )
+    
+    except StreamUnavailable as e:
+        logger.warning(f"⚠️ HLS playlist busy: {e}")
+        return await handle_error(
+            "server_busy",
+            status_code=503,
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    
+    except Exception as e:
+        logger.error(f"❌ HLS playlist failed BC: {e}")
+        return await handle_error("server_error")
+
+@app.api_route("/hls/{token}/media.mp4", methods=["GET", "HEAD"])
+async def hls_media_endpoint(token: str, key: str, request: Request):
+    """Fragmented MP4 behind an HLS playlist (init segment + keyframe fragments)"""
+    try:
+        # Verify access
+        success, token_data, error = await verify_request(request, token, key)
+        
+        if not success:
+            return await handle_error(error)
+        
+        # Get file
+        db = await get_db()
+        file_doc = await get_file_by_id(db, token_data["file_id"])
+        
+        if not file_doc:
+            return await handle_error("file_not_found")
+        
+        presentation = await get_hls_presentation(db, await init_stream_client(), file_doc)
+        
+        if not presentation:
+            return await handle_error("hls_unavailable", status_code=404)
+        
+        lease = await limit_connection(request, token, token_data)
+        return await stream_file(file_doc, request, presentation["layout"], token_data, lease)
+    
+    except TooManyConnections as e:
+        logger.warning(f"⚠️ HLS media over connection cap: {e}")
+        return await handle_error(
+            "too_many_connections",
+            status_code=429,
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    
+    except StreamUnavailable as e:
+        logger.warning(f"⚠️ HLS media busy: {e}")
+        return await handle_error(
+            "server_busy",
+            status_code=503,
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    
+    except Exception as e:
+        logger.error(f"❌ HLS media failed BC: {e}")
+        return await handle_error("server_error")
+
+@app.post("/warm/{token}")
+async def warm_endpoint(token: str, key: str, request: Request):
+    """Queue a freshly linked file's head and tail for background caching"""
+    try:
+        # Verify access (the bot calling this isn't a view)
+        success, token_data, error = await verify_request(request, token, key, count_access=False)
+        
+        if not success:
+            return await handle_error(error)
+        
+        # Get file
+        db = await get_db()
+        file_doc = await get_file_by_id(db, token_data["file_id"])
+        
+        if not file_doc:
+            return await handle_error("file_not_found")
+        
+        # Index new MP4s now, so the first viewer already gets the faststart layout
+        if Config.STREAM_VIRTUAL_FASTSTART:
+            schedule_index(db, file_doc)
+        
+        source = await init_stream_client()
+        file_size = file_doc.get("file_size") or await source.file_size(file_doc)
+        
+        return {"queued": await source.warm(file_doc, file_size)}
+    
+    except Exception as e:
+        logger.error(f"❌ Warm endpoint failed BC: {e}")
+        return await handle_error("server_error")
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
     return {
         "status": "healthy",
         "message": "Bot alive hai BC! 🔥",
-        "version": "1.0.0"
+        "version": "1.0.0",
+        "stream": await stream_stats()
     }
 
 @app.exception_handler(404)
@@ -0,0 +1,36 @@
+# Every upstream fetch covers one aligned block so blocks can be reused across requests
+# Telegram wants offsets and limits divisible by 4KB and never crossing a 1MB boundary
+BLOCK_SIZE = 1024 * 1024  # 1MB blocks
+
+def block_offset(index: int) -> int:
+    """Byte offset where a block starts"""
+    return index * BLOCK_SIZE
+
+def block_length(index: int, file_size: int) -> int:
+    """Number of bytes a block holds (last block may be short)"""
+    return max(0, min(BLOCK_SIZE, file_size - block_offset(index)))
+
+def block_count(file_size: int) -> int:
+    """Number of blocks in a file"""
+    return (file_size + BLOCK_SIZE - 1) // BLOCK_SIZE
+
+def blocks_for_range(start: int, end: int) -> list:
+    """
+    Map an inclusive byte range onto aligned blocks
+    Returns: list of (block_index, skip, take) where skip/take trim the block to the range
+    """
+    if end < start:
+        return []
+    
+    first = start // BLOCK_SIZE
+    last = end // BLOCK_SIZE
+    
+    blocks = []
+    
+    for index in range(first, last + 1):
+        block_start = block_offset(index)
+        skip = start - block_start if index == first else 0
+        stop = end - block_start + 1 if index == last else BLOCK_SIZE
+        blocks.append((index, skip, stop - skip))
+    
+    return blocks
@@ -0,0 +1,91 @@
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Optional
+from config import Config
+
+# RFC 7232 validators and RFC 7234 lifetimes for link responses
+
+def http_date(value: datetime) -> str:
+    """IMF-fixdate for a naive UTC datetime"""
+    return format_datetime(value.replace(microsecond=0, tzinfo=timezone.utc), usegmt=True)
+
+def cache_control(token_data: Optional[dict], final: bool = True) -> str:
+    """
+    Cache lifetime for a link's responses
+    Never longer than the link lives, and capped so deleted links drop out of caches
+    final: False when the URL may start serving other bytes (an MP4 that can still
+    switch to its faststart layout once indexed); caches then revalidate every use
+    """
+    max_age = Config.HTTP_CACHE_MAX_AGE
+    
+    if token_data and token_data.get("expiry_at"):
+        remaining = (token_data["expiry_at"] - datetime.utcnow()).total_seconds()
+        max_age = min(max_age, int(remaining))
+    
+    if max_age <= 0:
+        return "no-store"
+    
+    if not final:
+        return "public, no-cache"
+    
+    # What this URL serves is settled: raw bytes or a layout derived from them
+    return f"public, max-age={max_age}, immutable"
+
+def validator_headers(etag: str, last_modified: Optional[datetime], token_data: Optional[dict], final: bool = True) -> dict:
+    """ETag, Last-Modified and Cache-Control shared by 200/206/304 answers"""
+    headers = {
+        "ETag": etag,
+        "Cache-Control": cache_control(token_data, final)
+    }
+    
+    if last_modified:
+        headers["Last-Modified"] = http_date(last_modified)
+    
+    return headers
+
+def _etag_listed(header: str, etag: str) -> bool:
+    """Weak comparison of an If-None-Match list against our ETag"""
+    if header.strip() == "*":
+        return True
+    
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        
+        if candidate == opaque:
+            return True
+    
+    return False
+
+def is_revalidation(headers) -> bool:
+    """A conditional GET from a client that already holds a copy"""
+    return "if-none-match" in headers or "if-modified-since" in headers
+
+def not_modified(headers, etag: str, last_modified: Optional[datetime]) -> bool:
+    """
+    Should a GET/HEAD be answered with 304?
+    If-None-Match wins; If-Modified-Since is only looked at when it is absent
+    """
+    if_none_match = headers.get("if-none-match")
+    
+    if if_none_match:
+        return _etag_listed(if_none_match, etag)
+    
+    if_modified_since = headers.get("if-modified-since")
+    
+    if not if_modified_since or last_modified is None:
+        return False
+    
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    
+    if since.tzinfo:
+        since = since.astimezone(timezone.utc)
+    
+    return last_modified.replace(microsecond=0) <= since.replace(tzinfo=None)
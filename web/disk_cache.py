@@ -0,0 +1,348 @@
+import asyncio
+import json
+import logging
+import os
+import secrets
+from collections import OrderedDict
+from typing import Optional
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+INDEX_FILE = "index.json"
+INDEX_SAVE_INTERVAL = 30  # seconds
+
+class FileSlice:
+    """
+    A byte range of an open cached block file
+    Responses read it from the file only when it is about to be sent
+    """
+    
+    def __init__(self, fd: int, offset: int, count: int):
+        self.fd = fd
+        self.offset = offset
+        self.count = count
+    
+    def __len__(self) -> int:
+        return self.count
+    
+    def __getitem__(self, item: slice) -> "FileSlice":
+        start, stop, _ = item.indices(self.count)
+        return FileSlice(self.fd, self.offset + start, max(0, stop - start))
+    
+    def read(self) -> bytes:
+        return os.pread(self.fd, self.count, self.offset)
+
+class DiskBlockCache:
+    """
+    Disk-backed LRU cache of file blocks keyed by (file_unique_id, block_index)
+    Blocks are written to a temp file and renamed into place, so a crash never
+    leaves a half-written block behind. The LRU index (and the set of pinned
+    blocks) is saved periodically and reconciled against the directory on startup.
+    """
+    
+    def __init__(self):
+        self.directory = Config.STREAM_CACHE_DIR
+        self.max_bytes = Config.STREAM_CACHE_MAX_BYTES
+        self.entries = OrderedDict()  # (unique_id, index) -> size, oldest first
+        self.total_bytes = 0
+        self.pinned = set()  # keys never evicted (e.g. MP4 moov blocks)
+        self.dirty = False
+        self.enabled = False
+        self.saver_task = None
+        self.lock = asyncio.Lock()
+    
+    async def open(self, worker_id: int = None):
+        """
+        Load the index and start the background saver
+        With a worker_id, only that worker's slice of the cache is opened
+        """
+        if worker_id is not None:
+            # Each worker owns its own slice of the cache directory and budget
+            self.directory = os.path.join(Config.STREAM_CACHE_DIR, f"worker-{worker_id}")
+            self.max_bytes = Config.STREAM_CACHE_MAX_BYTES // Config.WEB_CONCURRENCY
+        
+        if self.max_bytes <= 0:
+            logger.info("⚠️ Disk block cache disabled")
+            return
+        
+        try:
+            await asyncio.to_thread(self._load)
+            self.enabled = True
+            self.saver_task = asyncio.create_task(self._save_loop())
+            logger.info(
+                f"✅ Disk block cache ready: {len(self.entries)} blocks, "
+                f"{self.total_bytes // (1024 * 1024)}MB"
+            )
+        except Exception as e:
+            logger.error(f"❌ Disk block cache failed to open BC: {e}")
+    
+    async def close(self):
+        """Stop the saver and persist the index"""
+        if not self.enabled:
+            return
+        
+        if self.saver_task:
+            self.saver_task.cancel()
+        
+        try:
+            await self._save_index()
+            logger.info("🛑 Disk block cache index saved")
+        except Exception as e:
+            logger.error(f"❌ Failed to save block cache index: {e}")
+    
+    async def get(self, unique_id: str, index: int) -> Optional[bytes]:
+        """Read a cached block, or None on miss"""
+        key = (unique_id, index)
+        
+        if not self.enabled or key not in self.entries:
+            return None
+        
+        try:
+            data = await asyncio.to_thread(self._read_block, unique_id, index)
+        except FileNotFoundError:
+            await self._forget(key)
+            return None
+        except Exception as e:
+            logger.error(f"❌ Block cache read failed: {e}")
+            return None
+        
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.dirty = True
+        
+        return data
+    
+    def has(self, unique_id: str, index: int) -> bool:
+        return self.enabled and (unique_id, index) in self.entries
+    
+    def cached_paths(self, unique_id: str, indexes: list) -> dict:
+        """{index: path} for the blocks that are on disk, marking them as recently used"""
+        paths = {}
+        
+        if not self.enabled:
+            return paths
+        
+        for index in indexes:
+            key = (unique_id, index)
+            
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                paths[index] = os.path.abspath(self._block_path(unique_id, index))
+        
+        if paths:
+            self.dirty = True
+        
+        return paths
+    
+    async def put(self, unique_id: str, index: int, data: bytes):
+        """Store a block and evict old ones past the byte budget"""
+        key = (unique_id, index)
+        
+        if not self.enabled or not data or key in self.entries or len(data) > self.max_bytes:
+            return
+        
+        try:
+            await asyncio.to_thread(self._write_block, unique_id, index, data)
+        except Exception as e:
+            logger.error(f"❌ Block cache write failed: {e}")
+            return
+        
+        async with self.lock:
+            if key not in self.entries:
+                self.entries[key] = len(data)
+                self.total_bytes += len(data)
+                self.dirty = True
+            
+            evicted = self._evict_over_budget()
+        
+        if evicted:
+            await asyncio.to_thread(self._remove_blocks, evicted)
+    
+    async def pin(self, unique_id: str, index: int) -> bool:
+        """Keep a cached block out of eviction; pinned blocks may use a quarter of the budget"""
+        key = (unique_id, index)
+        
+        async with self.lock:
+            if key in self.pinned:
+                return True
+            
+            if key not in self.entries:
+                return False
+            
+            pinned_bytes = sum(self.entries.get(k, 0) for k in self.pinned)
+            
+            if pinned_bytes + self.entries[key] > self.max_bytes // 4:
+                return False
+            
+            self.pinned.add(key)
+            self.dirty = True
+            return True
+    
+    def _evict_over_budget(self) -> list:
+        """Drop the coldest unpinned entries until the cache fits its budget"""
+        evicted = []
+        
+        for key in list(self.entries):
+            if self.total_bytes <= self.max_bytes:
+                break
+            
+            if key in self.pinned:
+                continue
+            
+            self.total_bytes -= self.entries.pop(key)
+            evicted.append(key)
+        
+        return evicted
+    
+    async def _forget(self, key: tuple):
+        """Drop an index entry whose file went missing"""
+        async with self.lock:
+            size = self.entries.pop(key, None)
+            self.pinned.discard(key)
+            
+            if size is not None:
+                self.total_bytes -= size
+                self.dirty = True
+    
+    async def _save_loop(self):
+        """Persist the index every few seconds when it changed"""
+        while True:
+            await asyncio.sleep(INDEX_SAVE_INTERVAL)
+            
+            if self.dirty:
+                try:
+                    await self._save_index()
+                except Exception as e:
+                    logger.error(f"❌ Failed to save block cache index: {e}")
+    
+    def _block_path(self, unique_id: str, index: int) -> str:
+        return os.path.join(self.directory, unique_id, f"{index}.blk")
+    
+    def _read_block(self, unique_id: str, index: int) -> bytes:
+        with open(self._block_path(unique_id, index), "rb") as f:
+            return f.read()
+    
+    def _write_block(self, unique_id: str, index: int, data: bytes):
+        path = self._block_path(unique_id, index)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        
+        tmp_path = f"{path}.{secrets.token_hex(4)}.tmp"
+        
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        
+        os.replace(tmp_path, path)
+    
+    def _remove_blocks(self, keys: list):
+        for unique_id, index in keys:
+            try:
+                os.remove(self._block_path(unique_id, index))
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                logger.error(f"❌ Failed to evict block: {e}")
+    
+    async def _save_index(self):
+        # Snapshot on the event loop, where entries and pinned are changed, so the
+        # copy can't race an update; only the file write goes to a thread
+        state = {
+            "entries": [[unique_id, index, size] for (unique_id, index), size in self.entries.items()],
+            "pinned": [[unique_id, index] for unique_id, index in self.pinned]
+        }
+        
+        # Changes made while writing mark it dirty again for the next round
+        self.dirty = False
+        
+        try:
+            await asyncio.to_thread(self._write_index, state)
+        except Exception:
+            self.dirty = True
+            raise
+    
+    def _write_index(self, state: dict):
+        path = os.path.join(self.directory, INDEX_FILE)
+        tmp_path = f"{path}.tmp"
+        
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        
+        os.replace(tmp_path, path)
+    
+    def _load(self):
+        """Rebuild the LRU index from the saved index and the files on disk"""
+        os.makedirs(self.directory, exist_ok=True)
+        
+        # Everything actually on disk, minus leftovers from interrupted writes
+        on_disk = {}
+        
+        for unique_id in os.listdir(self.directory):
+            file_dir = os.path.join(self.directory, unique_id)
+            
+            if not os.path.isdir(file_dir):
+                continue
+            
+            for name in os.listdir(file_dir):
+                path = os.path.join(file_dir, name)
+                
+                if name.endswith(".tmp"):
+                    os.remove(path)
+                    continue
+                
+                if not name.endswith(".blk"):
+                    continue
+                
+                try:
+                    index = int(name[:-4])
+                except ValueError:
+                    continue
+                
+                stat = os.stat(path)
+                on_disk[(unique_id, index)] = (stat.st_size, stat.st_mtime)
+        
+        saved = []
+        pinned = []
+        index_path = os.path.join(self.directory, INDEX_FILE)
+        
+        try:
+            with open(index_path) as f:
+                state = json.load(f)
+            
+            saved = state.get("entries", [])
+            pinned = state.get("pinned", [])
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.warning(f"⚠️ Block cache index unreadable, rebuilding: {e}")
+        
+        self.entries.clear()
+        self.total_bytes = 0
+        
+        # Blocks missing from the saved index go to the cold end, oldest first
+        saved_keys = {(unique_id, index) for unique_id, index, _ in saved}
+        orphans = sorted(
+            (key for key in on_disk if key not in saved_keys),
+            key=lambda key: on_disk[key][1]
+        )
+        
+        for key in orphans:
+            self.entries[key] = on_disk[key][0]
+        
+        for unique_id, index, _ in saved:
+            key = (unique_id, index)
+            
+            if key in on_disk:
+                self.entries[key] = on_disk[key][0]
+        
+        self.total_bytes = sum(self.entries.values())
+        self.pinned = {(unique_id, index) for unique_id, index in pinned if (unique_id, index) in self.entries}
+        
+        self._remove_blocks(self._evict_over_budget())
+        self.dirty = True
+
+# Global disk cache instance
+disk_cache = DiskBlockCache()
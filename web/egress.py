@@ -0,0 +1,101 @@
+import asyncio
+import heapq
+import itertools
+import time
+import weakref
+from config import Config
+
+# Chunks are paced in pieces of this size so one grant never hogs the uplink for long
+EGRESS_QUANTUM = 256 * 1024
+
+class Flow:
+    """One response's share of the uplink"""
+    
+    def __init__(self, weight: float):
+        self.weight = weight
+        self.finish = 0.0  # virtual finish time of this flow's last queued piece
+
+class EgressScheduler:
+    """
+    Self-clocked weighted fair queueing over a global byte rate
+    Every response asks for a grant before sending each piece; grants go out in
+    order of virtual finish time, so a weight-4 flow gets 4x the bytes of a
+    weight-1 flow while both are busy, and idle share goes to whoever is left
+    """
+    
+    def __init__(self):
+        # The machine-wide cap is split evenly between uvicorn workers
+        self.rate = Config.STREAM_EGRESS_MAX_RATE / max(1, Config.WEB_CONCURRENCY)
+        self.burst = max(EGRESS_QUANTUM, self.rate / 4)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.virtual_time = 0.0
+        self.queue = []  # (finish, seq, size, future)
+        self.seq = itertools.count()
+        self.dispatcher = None
+        self.flows = weakref.WeakValueDictionary()  # key -> Flow, alive while a response uses it
+    
+    def flow(self, premium: bool, key: tuple = None) -> Flow:
+        """
+        Flow weighted by the link's tier
+        Responses with the same key (e.g. one viewer's parallel range connections) share one flow
+        """
+        flow = self.flows.get(key) if key else None
+        
+        if flow is None:
+            flow = Flow(Config.STREAM_PREMIUM_WEIGHT if premium else Config.STREAM_FREE_WEIGHT)
+            
+            if key:
+                self.flows[key] = flow
+        
+        return flow
+    
+    def pieces(self, chunk: bytes) -> list:
+        """Split a chunk into paced pieces (left whole when there is no cap)"""
+        if self.rate <= 0:
+            return [chunk]
+        
+        # FileSlices slice without copying; bytes go through a memoryview for the same reason
+        view = memoryview(chunk) if isinstance(chunk, bytes) else chunk
+        return [view[pos:pos + EGRESS_QUANTUM] for pos in range(0, len(chunk), EGRESS_QUANTUM)]
+    
+    async def send(self, flow: Flow, size: int):
+        """Wait for this flow's turn to send size bytes (returns at once with no cap)"""
+        if self.rate <= 0:
+            return
+        
+        start = max(self.virtual_time, flow.finish)
+        flow.finish = start + size / flow.weight
+        
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.queue, (flow.finish, next(self.seq), size, future))
+        
+        if self.dispatcher is None or self.dispatcher.done():
+            self.dispatcher = asyncio.create_task(self._dispatch())
+        
+        # A cancelled waiter's future is skipped by the dispatcher
+        await future
+    
+    async def _dispatch(self):
+        while self.queue:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            
+            # Grants go out on credit; pay the debt off before the next one, then
+            # look at the queue again in case a more deserving piece arrived meanwhile
+            if self.tokens < 0:
+                await asyncio.sleep(-self.tokens / self.rate)
+                continue
+            
+            finish, _, size, future = heapq.heappop(self.queue)
+            
+            if future.done():
+                continue
+            
+            self.tokens -= size
+            self.virtual_time = finish
+            future.set_result(None)
+
+# Global egress scheduler instance
+egress = EgressScheduler()
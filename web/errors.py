@@ -1,7 +1,13 @@
+from functools import lru_cache
 from fastapi.responses import HTMLResponse
 
-def error_page(error_type: str, message: str) -> HTMLResponse:
+def error_page(error_type: str, message: str, status_code: int = 403, headers: dict = None) -> HTMLResponse:
     """Generate error page HTML"""
+    return HTMLResponse(content=error_html(error_type), status_code=status_code, headers=headers)
+
+@lru_cache(maxsize=None)
+def error_html(error_type: str) -> str:
+    """Error page markup, rendered once per error type (scanners hit these a lot)"""
     
     error_messages = {
         "invalid_token": {
@@ -34,6 +40,24 @@ def error_page(error_type: str, message: str) -> HTMLResponse:
             "message": "Server ki maa chud gayi!",
             "details": "Thodi der me try kar. Ya owner ko bol."
         },
+        "hls_unavailable": {
+            "title": "HLS Not Available! 🎞",
+            "emoji": "🎞",
+            "message": "Is file ka HLS nahi banega BC!",
+            "details": "Sirf MP4 videos ka playlist banta hai. Stream link use kar."
+        },
+        "server_busy": {
+            "title": "Server Busy! 🚦",
+            "emoji": "🚦",
+            "message": "Bahut bheed hai BC!",
+            "details": "Telegram ne thoda rok diya hai. Kuch seconds baad try kar."
+        },
+        "too_many_connections": {
+            "title": "Too Many Connections! 🚧",
+            "emoji": "🚧",
+            "message": "Itne saare connection kyu khol raha hai BC?",
+            "details": "Download manager ke connections kam kar. Premium walo ko zyada milte hai."
+        },
         "access_denied": {
             "title": "Access Denied! 🚫",
             "emoji": "🚫",
@@ -180,4 +204,4 @@ def error_page(error_type: str, message: str) -> HTMLResponse:
     </html>
     """
     
-    return HTMLResponse(content=html, status_code=403)
+    return html
@@ -0,0 +1,198 @@
+import logging
+import struct
+from collections import OrderedDict
+from typing import Optional
+from bot.services.files import choose_stream_layout
+from bot.services.media import get_media_index
+from web.governor import StreamUnavailable
+from web.indexer import looks_like_mp4
+from web.mp4 import MALFORMED, MP4Error, parse_box_header, iter_boxes, build_box
+from web.layout import VirtualLayout
+from web.stream import read_range
+
+logger = logging.getLogger(__name__)
+
+# Boxes on the path from moov down to the chunk offset tables
+REBUILT_BOXES = {b"moov", b"trak", b"mdia", b"minf", b"stbl"}
+
+# Rebuilt moov boxes are held in memory; cap their total rather than the count,
+# since one long recording can carry a moov of tens of MB
+MAX_LAYOUT_BYTES = 128 * 1024 * 1024
+
+# Recorded on the files document as stream_layout
+RAW = "raw"
+FASTSTART = "faststart"
+
+# unique_id -> VirtualLayout (or None when the file needs no relocation)
+layouts = OrderedDict()
+layout_bytes = 0
+
+def _rebuild(data: bytes, start: int, end: int, move) -> bytes:
+    """Copy boxes in data[start:end], rewriting chunk offsets with move()"""
+    out = []
+    
+    for box_type, box_start, payload, box_end in iter_boxes(data, start, end):
+        if box_type in REBUILT_BOXES:
+            out.append(build_box(box_type, _rebuild(data, payload, box_end, move)))
+        
+        elif box_type in (b"stco", b"co64"):
+            version_flags = data[payload:payload + 4]
+            count = struct.unpack_from(">I", data, payload + 4)[0]
+            fmt = "Q" if box_type == b"co64" else "I"
+            offsets = [move(o) for o in struct.unpack_from(f">{count}{fmt}", data, payload + 8)]
+            
+            # Offsets that no longer fit 32 bits force an upgrade to co64
+            if box_type == b"stco" and offsets and max(offsets) > 0xFFFFFFFF:
+                box_type, fmt = b"co64", "Q"
+            
+            table = struct.pack(f">{count}{fmt}", *offsets)
+            out.append(build_box(box_type, version_flags + struct.pack(">I", count) + table))
+        
+        else:
+            out.append(data[box_start:box_end])
+    
+    return b"".join(out)
+
+def relocate_moov(moov_bytes: bytes, mdat_offset: int, moov_offset: int) -> bytes:
+    """
+    Rebuild moov for a layout where it sits right before mdat
+    Everything from mdat up to the old moov shifts forward by the new moov size,
+    and anything after the old moov shifts by the size difference
+    """
+    box_type, size, header_size = parse_box_header(moov_bytes, 0)
+    
+    if box_type != b"moov":
+        raise MP4Error("Not a moov box")
+    
+    old_size = size or len(moov_bytes)
+    new_size = old_size
+    
+    # The new size depends on the offsets (stco -> co64), so settle it iteratively
+    for _ in range(4):
+        def move(offset, new_size=new_size):
+            if mdat_offset <= offset < moov_offset:
+                return offset + new_size
+            if offset >= moov_offset + old_size:
+                return offset + new_size - old_size
+            return offset
+        
+        try:
+            new_moov = build_box(b"moov", _rebuild(moov_bytes, header_size, old_size, move))
+        except MALFORMED as e:
+            raise MP4Error(f"Malformed chunk offsets: {e}")
+        
+        if len(new_moov) == new_size:
+            return new_moov
+        
+        new_size = len(new_moov)
+    
+    raise MP4Error("moov size did not settle")
+
+def faststart_layout(file_doc: dict, file_size: int, moov: dict, mdat: dict, new_moov: bytes) -> VirtualLayout:
+    """
+    A faststart view of a file: moov moved in front of mdat
+    Bytes are either the rebuilt moov (held in memory) or mapped back to original offsets
+    """
+    moov_end = moov["offset"] + moov["size"]
+    
+    return VirtualLayout(file_doc, file_size, f'"{file_doc["file_unique_id"]}-faststart"', [
+        (mdat["offset"], 0),
+        (len(new_moov), new_moov),
+        (moov["offset"] - mdat["offset"], mdat["offset"]),
+        (file_size - moov_end, moov_end),
+    ])
+
+def _held(layout: Optional[VirtualLayout]) -> int:
+    """Bytes a cached layout keeps in memory"""
+    if layout is None:
+        return 0
+    return sum(len(origin) for _, _, origin in layout.segments if not isinstance(origin, int))
+
+def _remember(unique_id: str, layout: Optional[VirtualLayout]):
+    global layout_bytes
+    
+    layouts[unique_id] = layout
+    layout_bytes += _held(layout)
+    
+    while layout_bytes > MAX_LAYOUT_BYTES and len(layouts) > 1:
+        _, evicted = layouts.popitem(last=False)
+        layout_bytes -= _held(evicted)
+
+def layout_settled(file_doc: dict) -> bool:
+    """True once this file's layout can't change any more (not an MP4, or on record)"""
+    return not looks_like_mp4(file_doc) or file_doc.get("stream_layout") is not None
+
+async def _build_layout(db, source, file_doc: dict) -> Optional[VirtualLayout]:
+    """Faststart layout from the file's index; None when not indexed or nothing to relocate"""
+    unique_id = file_doc["file_unique_id"]
+    
+    if unique_id in layouts:
+        layouts.move_to_end(unique_id)
+        return layouts[unique_id]
+    
+    index_doc = await get_media_index(db, unique_id)
+    
+    if not index_doc:
+        return None
+    
+    layout = None
+    
+    if index_doc.get("is_mp4") and not index_doc.get("faststart"):
+        moov, mdat = index_doc["moov"], index_doc["mdat"]
+        file_size = index_doc["file_size"]
+        
+        try:
+            moov_bytes = await read_range(source, file_doc, file_size, moov["offset"], moov["offset"] + moov["size"] - 1)
+            new_moov = relocate_moov(moov_bytes, mdat["offset"], moov["offset"])
+            layout = faststart_layout(file_doc, file_size, moov, mdat, new_moov)
+        except MP4Error as e:
+            logger.warning(f"⚠️ Virtual faststart unavailable for {unique_id}: {e}")
+    
+    _remember(unique_id, layout)
+    return layout
+
+async def get_virtual_layout(db, source, file_doc: dict, decide: bool = False) -> Optional[VirtualLayout]:
+    """
+    Layout a file is served with: its faststart layout, or None for the original bytes
+    The choice is made once, by the first request that starts playback (decide=True),
+    and recorded on the files document; every later request in every worker follows
+    it, so a player never sees sizes and offsets change under it. Until then the
+    original bytes are served, as they were to anyone before.
+    Raises StreamUnavailable when the moov can't be fetched right now
+    """
+    if not looks_like_mp4(file_doc):
+        return None
+    
+    unique_id = file_doc["file_unique_id"]
+    choice = file_doc.get("stream_layout")
+    
+    if choice is None:
+        if not decide:
+            return None
+        
+        try:
+            layout = await _build_layout(db, source, file_doc)
+        except StreamUnavailable:
+            # Busy pool: nothing is decided or served, the caller answers 503
+            raise
+        except Exception as e:
+            # Settling on the original bytes is safe; guessing later is not
+            logger.error(f"❌ Failed to build faststart layout for {unique_id}: {e}")
+            layout = None
+        
+        # Another worker may have decided first; its choice wins
+        choice = await choose_stream_layout(db, unique_id, FASTSTART if layout else RAW)
+        file_doc["stream_layout"] = choice
+        
+        if choice == FASTSTART and layout:
+            return layout
+    
+    if choice == RAW:
+        return None
+    
+    layout = await _build_layout(db, source, file_doc)
+    
+    if layout is None:
+        raise RuntimeError(f"Faststart layout of {unique_id} can't be rebuilt")
+    
+    return layout
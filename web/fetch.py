@@ -0,0 +1,115 @@
+import logging
+from pyrogram.errors import FloodWait, FileReferenceExpired
+from config import Config
+from web.blocks import BLOCK_SIZE, block_offset, block_length
+from web.disk_cache import disk_cache
+from web.hot_cache import hot_cache
+from web.pool import stream_pool
+from web.locations import file_locations
+from web.metrics import stream_metrics
+from web.warmup import warmup_lane
+from web.workers import startup_lock
+
+logger = logging.getLogger(__name__)
+
+class LocalBlockSource:
+    """
+    Serves blocks from this process: memory cache, then disk cache, then Telegram
+    Used directly by the web server, or by the fetcher daemon on behalf of all workers
+    """
+    
+    def __init__(self):
+        self.pool = stream_pool
+    
+    async def start(self, worker_id: int = None):
+        """Open the caches and log the Telegram sessions in"""
+        await disk_cache.open(worker_id)
+        
+        async with startup_lock():
+            await self.pool.start(worker_id or 0)
+        
+        if Config.STREAM_WARMUP:
+            warmup_lane.start(self)
+    
+    async def close(self):
+        """Stop the sessions and persist the cache index"""
+        await warmup_lane.stop()
+        await self.pool.stop()
+        await disk_cache.close()
+    
+    async def file_size(self, file_doc: dict) -> int:
+        """A file's size, from its cached location"""
+        location = await file_locations.resolve(self.pool, file_doc)
+        return location["file_size"]
+    
+    async def download_block(self, file_doc: dict, file_size: int, index: int) -> bytes:
+        """
+        Download one aligned block, waiting out a FloodWait while it fits in the lease wait
+        An expired file reference is refreshed once from the source message
+        Raises StreamUnavailable when no client can take it in time
+        """
+        location = await file_locations.resolve(self.pool, file_doc)
+        refreshed = False
+        
+        while True:
+            async with self.pool.lease() as stream_client:
+                try:
+                    block = await stream_client.client.download(
+                        location["file_id"],
+                        file_size=file_size,
+                        offset=block_offset(index),
+                        limit=BLOCK_SIZE
+                    )
+                    stream_client.bucket.on_success()
+                    stream_metrics.upstream_bytes += len(block or b"")
+                    return block
+                
+                except FloodWait as e:
+                    self.pool.penalize(stream_client, e.value)
+                    continue
+                
+                except FileReferenceExpired:
+                    if refreshed:
+                        raise
+            
+            location = await file_locations.refresh(self.pool, file_doc)
+            refreshed = True
+    
+    async def load_block(self, file_doc: dict, file_size: int, index: int) -> bytes:
+        """Read a block from disk, or download it and keep it there"""
+        unique_id = file_doc["file_unique_id"]
+        block = await disk_cache.get(unique_id, index)
+        
+        if block is not None:
+            return block
+        
+        block = await self.download_block(file_doc, file_size, index)
+        
+        # Only complete blocks are worth keeping
+        if block and len(block) == block_length(index, file_size):
+            await disk_cache.put(unique_id, index, block)
+        
+        return block
+    
+    async def block(self, file_doc: dict, file_size: int, index: int) -> bytes:
+        """Serve a block from memory, then disk, falling back to Telegram"""
+        size = block_length(index, file_size)
+        load = lambda: self.load_block(file_doc, file_size, index)
+        
+        return await hot_cache.get_or_fetch(file_doc["file_unique_id"], index, size, load)
+    
+    async def warm(self, file_doc: dict, file_size: int) -> bool:
+        """Queue a new file's head and tail for low-priority caching"""
+        return warmup_lane.enqueue(file_doc, file_size)
+    
+    async def cached_paths(self, file_doc: dict, indexes: list) -> dict:
+        """{index: path} of blocks that can be sent straight from disk"""
+        return disk_cache.cached_paths(file_doc["file_unique_id"], indexes)
+    
+    async def pin(self, file_doc: dict, file_size: int, indexes: list):
+        """Make sure blocks are on disk and keep them out of eviction"""
+        for index in indexes:
+            block = await self.block(file_doc, file_size, index)
+            
+            if block:
+                await disk_cache.pin(file_doc["file_unique_id"], index)
@@ -0,0 +1,248 @@
+import asyncio
+import json
+import logging
+import os
+import signal
+from config import Config
+from web.fetch import LocalBlockSource
+from web.governor import StreamUnavailable
+from web.metrics import stream_metrics
+
+logger = logging.getLogger(__name__)
+
+# Fetcher daemon: one process owns the Telegram sessions and the block cache and
+# serves blocks to every uvicorn worker over a Unix socket.
+#
+# Wire format, one request at a time per connection:
+#   request:  JSON line {"op": "block" | "pin" | "paths" | "warm" | "size" | "stats" | "ping", ...}
+#   response: JSON line {"ok": bool, "length": n, ...} followed by n raw bytes
+
+# Fields of a file document the daemon needs to fetch (and refresh) a file
+FILE_REF_FIELDS = ("file_id", "current_file_id", "file_unique_id", "file_size", "chat_id", "message_id")
+
+def file_ref(doc: dict) -> dict:
+    return {field: doc.get(field) for field in FILE_REF_FIELDS}
+
+class FetcherError(Exception):
+    """The fetcher daemon could not serve a request"""
+
+class FetcherClient:
+    """Block source that forwards every fetch to the fetcher daemon"""
+    
+    def __init__(self, path: str):
+        self.path = path
+        self.idle = []  # reusable (reader, writer) pairs
+    
+    async def start(self, worker_id: int = None):
+        """Make sure the daemon is reachable"""
+        await self._request({"op": "ping"})
+        logger.info(f"✅ Connected to fetcher daemon at {self.path}")
+    
+    async def close(self):
+        """Drop pooled connections"""
+        for _, writer in self.idle:
+            writer.close()
+        
+        self.idle = []
+    
+    async def file_size(self, file_doc: dict) -> int:
+        header, _ = await self._request({"op": "size", **file_ref(file_doc)})
+        return header["file_size"]
+    
+    async def block(self, file_doc: dict, file_size: int, index: int) -> bytes:
+        _, data = await self._request({
+            "op": "block",
+            **file_ref(file_doc),
+            "file_size": file_size,
+            "index": index
+        })
+        return data
+    
+    async def cached_paths(self, file_doc: dict, indexes: list) -> dict:
+        # The daemon's cache is on this machine, so its block files can be read directly
+        header, _ = await self._request({"op": "paths", **file_ref(file_doc), "indexes": indexes})
+        return {int(index): path for index, path in header["paths"].items()}
+    
+    async def warm(self, file_doc: dict, file_size: int) -> bool:
+        header, _ = await self._request({"op": "warm", **file_ref(file_doc), "file_size": file_size})
+        return header["queued"]
+    
+    async def stats(self) -> dict:
+        header, _ = await self._request({"op": "stats"})
+        return header["stats"]
+    
+    async def pin(self, file_doc: dict, file_size: int, indexes: list):
+        await self._request({
+            "op": "pin",
+            **file_ref(file_doc),
+            "file_size": file_size,
+            "indexes": indexes
+        })
+    
+    async def _request(self, payload: dict) -> tuple:
+        if self.idle:
+            reader, writer = self.idle.pop()
+        else:
+            reader, writer = await asyncio.open_unix_connection(self.path)
+        
+        try:
+            writer.write(json.dumps(payload).encode() + b"\n")
+            await writer.drain()
+            
+            line = await reader.readline()
+            
+            if not line:
+                raise FetcherError("Fetcher daemon closed the connection")
+            
+            header = json.loads(line)
+            data = await reader.readexactly(header.get("length", 0))
+        
+        except BaseException:
+            # A half-read connection can't be reused
+            writer.close()
+            raise
+        
+        if len(self.idle) < Config.FETCHER_MAX_IDLE:
+            self.idle.append((reader, writer))
+        else:
+            writer.close()
+        
+        if not header["ok"]:
+            if header.get("error") == "busy":
+                raise StreamUnavailable(header.get("retry_after", 1))
+            
+            raise FetcherError(header.get("error", "unknown error"))
+        
+        return header, data
+
+async def unless_closed(reader, coro):
+    """Run coro, cancelling it if the worker hangs up first (e.g. its viewer disconnected)"""
+    work = asyncio.ensure_future(coro)
+    hangup = asyncio.ensure_future(reader.read(1))
+    
+    try:
+        await asyncio.wait({work, hangup}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        # Requests are strictly one at a time, so any read result means the worker is gone
+        if not work.done():
+            work.cancel()
+        
+        if not hangup.done():
+            hangup.cancel()
+    
+    if not work.done() or work.cancelled():
+        raise ConnectionResetError("Worker hung up mid-request")
+    
+    return work.result()
+
+async def handle_connection(source: LocalBlockSource, reader, writer):
+    """Serve requests from one worker connection until it closes"""
+    try:
+        while True:
+            line = await reader.readline()
+            
+            if not line:
+                break
+            
+            data = b""
+            
+            try:
+                request = json.loads(line)
+                op = request.get("op")
+                
+                if op == "block":
+                    file_doc = file_ref(request)
+                    data = await unless_closed(reader, source.block(file_doc, request["file_size"], request["index"])) or b""
+                    header = {"ok": True}
+                
+                elif op == "pin":
+                    file_doc = file_ref(request)
+                    await source.pin(file_doc, request["file_size"], request["indexes"])
+                    header = {"ok": True}
+                
+                elif op == "size":
+                    header = {"ok": True, "file_size": await source.file_size(file_ref(request))}
+                
+                elif op == "paths":
+                    header = {"ok": True, "paths": await source.cached_paths(file_ref(request), request["indexes"])}
+                
+                elif op == "warm":
+                    header = {"ok": True, "queued": await source.warm(file_ref(request), request["file_size"])}
+                
+                elif op == "stats":
+                    header = {"ok": True, "stats": stream_metrics.snapshot()}
+                
+                elif op == "ping":
+                    header = {"ok": True}
+                
+                else:
+                    header = {"ok": False, "error": f"unknown op {op}"}
+            
+            except StreamUnavailable as e:
+                header = {"ok": False, "error": "busy", "retry_after": e.retry_after}
+            
+            except ConnectionError:
+                raise
+            
+            except Exception as e:
+                logger.error(f"❌ Fetcher request failed: {e}")
+                header = {"ok": False, "error": str(e)}
+            
+            header["length"] = len(data)
+            writer.write(json.dumps(header).encode() + b"\n")
+            
+            if data:
+                writer.write(data)
+            
+            await writer.drain()
+    
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    
+    finally:
+        writer.close()
+
+async def serve():
+    """Run the fetcher daemon until SIGTERM/SIGINT"""
+    source = LocalBlockSource()
+    await source.start()
+    
+    path = Config.FETCHER_SOCKET
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    
+    if os.path.exists(path):
+        os.remove(path)
+    
+    server = await asyncio.start_unix_server(
+        lambda reader, writer: handle_connection(source, reader, writer),
+        path=path
+    )
+    logger.info(f"🚀 Fetcher daemon listening on {path}")
+    
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+    
+    try:
+        await stop.wait()
+    finally:
+        logger.info("🛑 Shutting down fetcher daemon...")
+        server.close()
+        await server.wait_closed()
+        await source.close()
+        
+        if os.path.exists(path):
+            os.remove(path)
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    
+    if not Config.FETCHER_SOCKET:
+        raise SystemExit("❌ FETCHER_SOCKET set kar pehle BC!")
+    
+    asyncio.run(serve())
@@ -0,0 +1,54 @@
+import math
+import time
+from config import Config
+
+class StreamUnavailable(Exception):
+    """No stream client can serve the request within the allowed wait"""
+    
+    def __init__(self, retry_after: float):
+        self.retry_after = max(1, math.ceil(retry_after))
+        super().__init__(f"Stream clients busy, retry after {self.retry_after}s")
+
+class TokenBucket:
+    """
+    Per-client request budget that learns from FloodWait
+    The refill rate is halved on every FloodWait and creeps back up on success,
+    so a client slows down before Telegram has to penalize it again
+    """
+    
+    def __init__(self):
+        self.max_rate = Config.STREAM_CLIENT_RATE
+        self.min_rate = max(0.1, self.max_rate / 20)
+        self.rate = self.max_rate
+        self.capacity = max(1.0, self.max_rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+    
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+    
+    def wait_time(self) -> float:
+        """Seconds until one request can be sent"""
+        self._refill()
+        
+        if self.tokens >= 1:
+            return 0.0
+        
+        return (1 - self.tokens) / self.rate
+    
+    def consume(self):
+        """Spend one request"""
+        self._refill()
+        self.tokens -= 1
+    
+    def on_flood(self):
+        """Back off: halve the rate and empty the budget"""
+        self._refill()
+        self.rate = max(self.min_rate, self.rate / 2)
+        self.tokens = min(self.tokens, 0.0)
+    
+    def on_success(self):
+        """Recover slowly towards the configured rate"""
+        self.rate = min(self.max_rate, self.rate + self.max_rate / 100)
@@ -0,0 +1,339 @@
+import asyncio
+import logging
+import math
+import struct
+from bisect import bisect_left
+from collections import OrderedDict
+from typing import Optional
+from config import Config
+from bot.services.media import get_media_index
+from web.governor import StreamUnavailable
+from web.indexer import looks_like_mp4
+from web.layout import VirtualLayout
+from web.mp4 import MALFORMED, MP4Error, parse_box_header, iter_boxes, find_box, build_box, build_full_box, parse_moov
+from web.stream import read_range
+
+logger = logging.getLogger(__name__)
+
+# HLS over a plain MP4 without transcoding: the file is presented as a virtual
+# fragmented MP4 (init segment + one moof/mdat pair per keyframe-aligned fragment).
+# Each fragment's mdat payload is an untouched byte range of the original file,
+# so only the small moof headers live in memory and the rest comes from the block cache.
+
+MAX_PRESENTATIONS = 16
+
+SYNC_SAMPLE_FLAGS = 0x02000000  # sample_depends_on = 2 (depends on nothing)
+NON_SYNC_SAMPLE_FLAGS = 0x01010000  # sample_depends_on = 1, sample_is_non_sync_sample
+
+TFHD_DEFAULT_BASE_IS_MOOF = 0x020000
+TRUN_FLAGS = 0x000001 | 0x000100 | 0x000200 | 0x000400  # data offset, duration, size, flags
+TRUN_COMPOSITION_OFFSETS = 0x000800
+
+# Sample tables are empty in an init segment; samples are described by each moof instead
+EMPTY_SAMPLE_TABLES = (
+    build_full_box(b"stts", 0, 0, struct.pack(">I", 0)) +
+    build_full_box(b"stsc", 0, 0, struct.pack(">I", 0)) +
+    build_full_box(b"stsz", 0, 0, struct.pack(">II", 0, 0)) +
+    build_full_box(b"stco", 0, 0, struct.pack(">I", 0))
+)
+
+# unique_id -> presentation dict (or None when the file can't be served as HLS)
+presentations = OrderedDict()
+
+def _strip_sample_tables(data: bytes, start: int, end: int) -> bytes:
+    """Copy boxes in data[start:end], keeping only stsd inside each stbl"""
+    out = []
+    
+    for box_type, box_start, payload, box_end in iter_boxes(data, start, end):
+        if box_type == b"mvex":
+            continue
+        
+        if box_type in (b"trak", b"mdia", b"minf"):
+            out.append(build_box(box_type, _strip_sample_tables(data, payload, box_end)))
+        
+        elif box_type == b"stbl":
+            stsd = find_box(data, payload, box_end, b"stsd")
+            
+            if not stsd:
+                raise MP4Error("Sample table without stsd")
+            
+            out.append(build_box(b"stbl", data[stsd[0]:stsd[2]] + EMPTY_SAMPLE_TABLES))
+        
+        else:
+            out.append(data[box_start:box_end])
+    
+    return b"".join(out)
+
+def build_init_moov(moov_bytes: bytes, track_ids: list) -> bytes:
+    """moov for an init segment: empty sample tables plus mvex/trex for every track"""
+    _, size, header_size = parse_box_header(moov_bytes, 0)
+    
+    try:
+        body = _strip_sample_tables(moov_bytes, header_size, size or len(moov_bytes))
+    except MALFORMED as e:
+        raise MP4Error(f"Malformed sample tables: {e}")
+    
+    trex = b"".join(
+        build_full_box(b"trex", 0, 0, struct.pack(">IIIII", track_id, 1, 0, 0, 0))
+        for track_id in track_ids
+    )
+    
+    return build_box(b"moov", body + build_box(b"mvex", trex))
+
+def sample_durations(track: dict) -> list:
+    """Per-sample durations from decode times; the last one runs to the track's end"""
+    times = track["sample_times"]
+    
+    if not times:
+        return []
+    
+    durations = [b - a for a, b in zip(times, times[1:])]
+    
+    if track["duration"] > times[-1]:
+        durations.append(track["duration"] - times[-1])
+    else:
+        durations.append(durations[-1] if durations else 0)
+    
+    return durations
+
+def plan_fragments(tracks: list, main: dict, target_seconds: float) -> list:
+    """
+    Cut the file at keyframes of the main track, roughly target_seconds apart
+    Returns: [{"offset", "length", "duration", "trafs": [(track_index, first, last)]}]
+    """
+    for track in tracks:
+        offsets = track["sample_offsets"]
+        
+        if any(b <= a for a, b in zip(offsets, offsets[1:])):
+            raise MP4Error("Samples are not stored in decode order")
+    
+    times = main["sample_times"]
+    timescale = main["timescale"] or 1
+    cuts = [0]
+    
+    for sample in main["sync_samples"]:
+        if sample > cuts[-1] and times[sample] - times[cuts[-1]] >= target_seconds * timescale:
+            cuts.append(sample)
+    
+    # Byte boundaries: each cut's keyframe, widened to cover every sample at the edges
+    bounds = [main["sample_offsets"][cut] for cut in cuts]
+    bounds[0] = min(track["sample_offsets"][0] for track in tracks)
+    bounds.append(max(track["sample_offsets"][-1] + track["sample_sizes"][-1] for track in tracks))
+    
+    end_time = times[-1] + sample_durations(main)[-1]
+    fragments = []
+    
+    for i, cut in enumerate(cuts):
+        lo, hi = bounds[i], bounds[i + 1]
+        trafs = []
+        
+        for track_index, track in enumerate(tracks):
+            offsets = track["sample_offsets"]
+            first, last = bisect_left(offsets, lo), bisect_left(offsets, hi)
+            
+            if first == last:
+                continue
+            
+            if offsets[last - 1] + track["sample_sizes"][last - 1] > hi:
+                raise MP4Error("Sample straddles a fragment boundary")
+            
+            trafs.append((track_index, first, last))
+        
+        next_time = times[cuts[i + 1]] if i + 1 < len(cuts) else end_time
+        
+        fragments.append({
+            "offset": lo,
+            "length": hi - lo,
+            "duration": (next_time - times[cut]) / timescale,
+            "trafs": trafs
+        })
+    
+    return fragments
+
+def _runs(track: dict, first: int, last: int) -> list:
+    """Split samples first..last-1 into byte-contiguous (start, count) runs"""
+    offsets, sizes = track["sample_offsets"], track["sample_sizes"]
+    runs = []
+    
+    for sample in range(first, last):
+        if runs and offsets[sample] == offsets[sample - 1] + sizes[sample - 1]:
+            runs[-1][1] += 1
+        else:
+            runs.append([sample, 1])
+    
+    return runs
+
+def fragment_header(sequence: int, fragment: dict, tracks: list, durations: list, sync_sets: list) -> bytes:
+    """moof plus the mdat header that precede one fragment's original bytes"""
+    payload_length = fragment["length"]
+    
+    if payload_length + 8 <= 0xFFFFFFFF:
+        mdat_header = struct.pack(">I4s", payload_length + 8, b"mdat")
+    else:
+        mdat_header = struct.pack(">I4sQ", 1, b"mdat", payload_length + 16)
+    
+    plans = []
+    moof_size = 8 + 16  # moof header + mfhd
+    
+    for track_index, first, last in fragment["trafs"]:
+        track = tracks[track_index]
+        runs = _runs(track, first, last)
+        width = 16 if track["composition_offsets"] else 12
+        moof_size += 8 + 16 + 20  # traf header + tfhd + tfdt (version 1)
+        moof_size += sum(20 + count * width for _, count in runs)
+        plans.append((track_index, first, runs))
+    
+    base = moof_size + len(mdat_header) - fragment["offset"]
+    trafs = []
+    
+    for track_index, first, runs in plans:
+        track = tracks[track_index]
+        offsets, sizes = track["sample_offsets"], track["sample_sizes"]
+        composition = track["composition_offsets"]
+        durations_of, sync = durations[track_index], sync_sets[track_index]
+        
+        boxes = [
+            build_full_box(b"tfhd", 0, TFHD_DEFAULT_BASE_IS_MOOF, struct.pack(">I", track["track_id"])),
+            build_full_box(b"tfdt", 1, 0, struct.pack(">Q", track["sample_times"][first]))
+        ]
+        
+        for start, count in runs:
+            entries = []
+            
+            for sample in range(start, start + count):
+                flags = SYNC_SAMPLE_FLAGS if sync is None or sample in sync else NON_SYNC_SAMPLE_FLAGS
+                entries += [durations_of[sample], sizes[sample], flags]
+                
+                if composition:
+                    entries.append(composition[sample])
+            
+            if composition:
+                # Version 1 makes composition offsets signed, which covers both ctts versions
+                fmt = ">" + "IIIi" * count
+                version, flags = 1, TRUN_FLAGS | TRUN_COMPOSITION_OFFSETS
+            else:
+                fmt = ">" + "III" * count
+                version, flags = 0, TRUN_FLAGS
+            
+            header = struct.pack(">Ii", count, base + offsets[start])
+            boxes.append(build_full_box(b"trun", version, flags, header + struct.pack(fmt, *entries)))
+        
+        trafs.append(build_box(b"traf", b"".join(boxes)))
+    
+    moof = build_box(b"moof", build_full_box(b"mfhd", 0, 0, struct.pack(">I", sequence)) + b"".join(trafs))
+    
+    if len(moof) != moof_size:
+        raise MP4Error("moof size mismatch")
+    
+    return moof + mdat_header
+
+def build_presentation(file_doc: dict, file_size: int, ftyp_bytes: bytes, moov_bytes: bytes) -> dict:
+    """Parse moov and lay out the whole virtual fragmented file (CPU only, runs in a thread)"""
+    movie = parse_moov(moov_bytes)
+    tracks = [track for track in movie["tracks"] if track["sample_sizes"]]
+    
+    if not tracks or any(track["track_id"] is None for track in movie["tracks"]):
+        raise MP4Error("No usable tracks")
+    
+    main = next((track for track in tracks if track["handler"] == "vide"), tracks[0])
+    fragments = plan_fragments(tracks, main, Config.HLS_SEGMENT_SECONDS)
+    
+    durations = [sample_durations(track) for track in tracks]
+    sync_sets = [
+        None if len(track["sync_samples"]) == len(track["sample_sizes"]) else set(track["sync_samples"])
+        for track in tracks
+    ]
+    
+    init = ftyp_bytes + build_init_moov(moov_bytes, [track["track_id"] for track in movie["tracks"]])
+    pieces = [(len(init), init)]
+    segments = []
+    position = len(init)
+    
+    for sequence, fragment in enumerate(fragments, start=1):
+        header = fragment_header(sequence, fragment, tracks, durations, sync_sets)
+        pieces += [(len(header), header), (fragment["length"], fragment["offset"])]
+        
+        length = len(header) + fragment["length"]
+        segments.append((fragment["duration"], position, length))
+        position += length
+    
+    etag = f'"{file_doc["file_unique_id"]}-hls{Config.HLS_SEGMENT_SECONDS:g}"'
+    
+    return {
+        "layout": VirtualLayout(file_doc, file_size, etag, pieces, content_type="video/mp4"),
+        "init_length": len(init),
+        "segments": segments
+    }
+
+def render_playlist(presentation: dict, media_uri: str) -> str:
+    """VOD media playlist with EXT-X-BYTERANGE segments into one media URI"""
+    segments = presentation["segments"]
+    target = max(1, math.ceil(max(duration for duration, _, _ in segments)))
+    
+    lines = [
+        "#EXTM3U",
+        "#EXT-X-VERSION:7",
+        f"#EXT-X-TARGETDURATION:{target}",
+        "#EXT-X-MEDIA-SEQUENCE:0",
+        "#EXT-X-PLAYLIST-TYPE:VOD",
+        "#EXT-X-INDEPENDENT-SEGMENTS",
+        f'#EXT-X-MAP:URI="{media_uri}",BYTERANGE="{presentation["init_length"]}@0"'
+    ]
+    
+    for duration, offset, length in segments:
+        lines += [f"#EXTINF:{duration:.3f},", f"#EXT-X-BYTERANGE:{length}@{offset}", media_uri]
+    
+    lines.append("#EXT-X-ENDLIST")
+    return "\n".join(lines) + "\n"
+
+async def get_hls_presentation(db, source, file_doc: dict) -> Optional[dict]:
+    """
+    HLS view of an indexed MP4
+    Returns None when the file can't be served as HLS
+    Raises StreamUnavailable while the file is still being indexed
+    """
+    unique_id = file_doc["file_unique_id"]
+    
+    if unique_id in presentations:
+        presentations.move_to_end(unique_id)
+        return presentations[unique_id]
+    
+    if not looks_like_mp4(file_doc):
+        return None
+    
+    index_doc = await get_media_index(db, unique_id)
+    
+    if not index_doc:
+        raise StreamUnavailable(Config.STREAM_MAX_WAIT)
+    
+    presentation = None
+    
+    if index_doc.get("is_mp4"):
+        moov = index_doc["moov"]
+        file_size = index_doc["file_size"]
+        ftyp = next((box for box in index_doc["layout"] if box["type"] == "ftyp"), None)
+        
+        try:
+            moov_bytes = await read_range(source, file_doc, file_size, moov["offset"], moov["offset"] + moov["size"] - 1)
+            ftyp_bytes = b""
+            
+            if ftyp:
+                ftyp_bytes = await read_range(source, file_doc, file_size, ftyp["offset"], ftyp["offset"] + ftyp["size"] - 1)
+            
+            presentation = await asyncio.to_thread(build_presentation, file_doc, file_size, ftyp_bytes, moov_bytes)
+            logger.info(f"✅ HLS ready for {unique_id}: {len(presentation['segments'])} segments")
+        
+        except MP4Error as e:
+            logger.warning(f"⚠️ HLS unavailable for {unique_id}: {e}")
+        
+        except Exception as e:
+            # Probably a transient fetch failure; try again on the next request
+            logger.error(f"❌ Failed to build HLS for {unique_id}: {e}")
+            raise
+    
+    presentations[unique_id] = presentation
+    
+    while len(presentations) > MAX_PRESENTATIONS:
+        presentations.popitem(last=False)
+    
+    return presentation
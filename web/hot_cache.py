@@ -0,0 +1,101 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional
+from config import Config
+from web.metrics import stream_metrics
+
+logger = logging.getLogger(__name__)
+
+class HotBlockCache:
+    """
+    In-memory LRU of recently served blocks with single-flight loading
+    Concurrent requests for the same block share one upstream fetch
+    """
+    
+    def __init__(self):
+        self.max_bytes = Config.STREAM_MEMORY_CACHE_MAX_BYTES
+        self.blocks = OrderedDict()  # (unique_id, index) -> bytes, oldest first
+        self.total_bytes = 0
+        self.inflight = {}  # (unique_id, index) -> Task
+        self.waiters = {}  # (unique_id, index) -> requests still waiting on the task
+    
+    def get(self, unique_id: str, index: int) -> Optional[bytes]:
+        """Return a cached block, or None on miss"""
+        key = (unique_id, index)
+        block = self.blocks.get(key)
+        
+        if block is not None:
+            self.blocks.move_to_end(key)
+        
+        return block
+    
+    def put(self, unique_id: str, index: int, block: bytes):
+        """Keep a block in memory, evicting the coldest past the budget"""
+        key = (unique_id, index)
+        
+        if not block or len(block) > self.max_bytes or key in self.blocks:
+            return
+        
+        self.blocks[key] = block
+        self.total_bytes += len(block)
+        
+        while self.total_bytes > self.max_bytes:
+            _, old_block = self.blocks.popitem(last=False)
+            self.total_bytes -= len(old_block)
+    
+    async def get_or_fetch(self, unique_id: str, index: int, size: int, fetch: Callable[[], Awaitable[bytes]]) -> bytes:
+        """
+        Return a block from memory or join/start the single upstream fetch for it
+        Only blocks that come back with the expected size are kept
+        """
+        block = self.get(unique_id, index)
+        
+        if block is not None:
+            return block
+        
+        key = (unique_id, index)
+        task = self.inflight.get(key)
+        
+        if task is None:
+            # The fetch belongs to the cache, not to whichever request started it,
+            # so one viewer disconnecting doesn't fail everyone else waiting on it
+            task = asyncio.create_task(self._load(key, size, fetch))
+            self.inflight[key] = task
+        
+        self.waiters[key] = self.waiters.get(key, 0) + 1
+        
+        try:
+            return await asyncio.shield(task)
+        
+        except asyncio.CancelledError:
+            # Nobody left to read it: stop the upstream download too
+            if self.waiters[key] == 1 and not task.done():
+                task.cancel()
+                self.inflight.pop(key, None)
+                stream_metrics.cancelled_fetches += 1
+            
+            raise
+        
+        finally:
+            self.waiters[key] -= 1
+            
+            if not self.waiters[key]:
+                del self.waiters[key]
+    
+    async def _load(self, key: tuple, size: int, fetch: Callable[[], Awaitable[bytes]]) -> bytes:
+        try:
+            block = await fetch()
+            
+            if block and len(block) == size:
+                self.put(key[0], key[1], block)
+            
+            return block
+        
+        finally:
+            # A cancelled fetch may already have been replaced by a newer one
+            if self.inflight.get(key) is asyncio.current_task():
+                del self.inflight[key]
+
+# Global hot block cache instance
+hot_cache = HotBlockCache()
@@ -0,0 +1,139 @@
+import asyncio
+import logging
+from typing import Optional
+from bot.services.media import get_media_index, save_media_index
+from web.blocks import blocks_for_range
+from web.mp4 import MP4Error, parse_box_header, parse_moov
+from web.stream import init_stream_client, read_range
+
+logger = logging.getLogger(__name__)
+
+MP4_MIME_TYPES = {"video/mp4", "video/quicktime", "video/x-m4v", "audio/mp4", "audio/x-m4a"}
+MP4_EXTENSIONS = (".mp4", ".m4v", ".mov", ".m4a")
+
+MAX_TOP_LEVEL_BOXES = 64
+MAX_MOOV_BYTES = 64 * 1024 * 1024
+
+# unique_ids already indexed (or found not to be MP4) by this process, and running jobs
+indexed = set()
+running = {}
+
+def looks_like_mp4(file_doc: dict) -> bool:
+    """Cheap check before spending any fetches on a file"""
+    mime_type = (file_doc.get("mime_type") or "").lower()
+    file_name = (file_doc.get("file_name") or "").lower()
+    return mime_type in MP4_MIME_TYPES or file_name.endswith(MP4_EXTENSIONS)
+
+async def read_top_level_boxes(source, file_doc: dict, file_size: int) -> list:
+    """Walk the top-level boxes, reading only their headers"""
+    boxes = []
+    pos = 0
+    
+    while pos + 8 <= file_size and len(boxes) < MAX_TOP_LEVEL_BOXES:
+        header = await read_range(source, file_doc, file_size, pos, min(pos + 15, file_size - 1))
+        box_type, size, _ = parse_box_header(header, 0)
+        
+        if size == 0:
+            size = file_size - pos
+        
+        boxes.append({"type": box_type.decode("latin-1"), "offset": pos, "size": size})
+        pos += size
+    
+    return boxes
+
+def find_top_level(boxes: list, box_type: str) -> Optional[dict]:
+    for box in boxes:
+        if box["type"] == box_type:
+            return box
+    
+    return None
+
+async def index_mp4(db, source, file_doc: dict) -> Optional[dict]:
+    """
+    Parse an MP4's box layout once, store it, and pin the moov bytes in cache
+    Returns the stored index document, or None if the file isn't a usable MP4
+    """
+    unique_id = file_doc["file_unique_id"]
+    file_size = file_doc.get("file_size") or await source.file_size(file_doc)
+    
+    index_doc = {"file_unique_id": unique_id, "file_size": file_size, "is_mp4": False}
+    
+    try:
+        boxes = await read_top_level_boxes(source, file_doc, file_size)
+        moov = find_top_level(boxes, "moov")
+        mdat = find_top_level(boxes, "mdat")
+        
+        if not moov or not mdat or moov["size"] > MAX_MOOV_BYTES:
+            raise MP4Error("No usable moov/mdat")
+        
+        moov_end = moov["offset"] + moov["size"] - 1
+        moov_bytes = await read_range(source, file_doc, file_size, moov["offset"], moov_end)
+        movie = parse_moov(moov_bytes)
+    
+    except MP4Error as e:
+        logger.info(f"⚠️ Not indexing {unique_id}: {e}")
+        await save_media_index(db, index_doc)
+        return None
+    
+    index_doc.update({
+        "is_mp4": True,
+        "layout": boxes,
+        "moov": {"offset": moov["offset"], "size": moov["size"]},
+        "mdat": {"offset": mdat["offset"], "size": mdat["size"]},
+        "faststart": moov["offset"] < mdat["offset"],
+        "duration": movie["duration"] / (movie["timescale"] or 1),
+        "tracks": [
+            {
+                "track_id": track["track_id"],
+                "handler": track["handler"],
+                "codec": track["codec"],
+                "timescale": track["timescale"],
+                "sample_count": len(track["sample_sizes"])
+            }
+            for track in movie["tracks"]
+        ]
+    })
+    
+    # Keep the head and the whole moov on disk so playback starts with one round trip
+    pinned = {0} | {index for index, _, _ in blocks_for_range(moov["offset"], moov_end)}
+    await source.pin(file_doc, file_size, sorted(pinned))
+    
+    await save_media_index(db, index_doc)
+    logger.info(f"✅ MP4 indexed: {unique_id} ({len(movie['tracks'])} tracks)")
+    return index_doc
+
+async def _run_index(db, file_doc: dict):
+    unique_id = file_doc["file_unique_id"]
+    
+    try:
+        if not await get_media_index(db, unique_id):
+            source = await init_stream_client()
+            await index_mp4(db, source, file_doc)
+        
+        indexed.add(unique_id)
+    
+    except Exception as e:
+        logger.error(f"❌ MP4 indexing failed for {unique_id}: {e}")
+    
+    finally:
+        running.pop(unique_id, None)
+
+def schedule_index(db, file_doc: dict):
+    """Index a file in the background when it is linked (warm-up) or first streamed"""
+    unique_id = file_doc["file_unique_id"]
+    
+    if unique_id in indexed or unique_id in running or not looks_like_mp4(file_doc):
+        return
+    
+    running[unique_id] = asyncio.create_task(_run_index(db, file_doc))
+
+async def ensure_index(db, file_doc: dict, timeout: float):
+    """Start indexing if needed and wait up to timeout seconds for it to finish"""
+    schedule_index(db, file_doc)
+    task = running.get(file_doc["file_unique_id"])
+    
+    if task:
+        try:
+            await asyncio.wait_for(asyncio.shield(task), timeout)
+        except asyncio.TimeoutError:
+            pass
@@ -0,0 +1,69 @@
+import logging
+from bisect import bisect_right
+from contextlib import aclosing
+from typing import Optional
+from web.stream import stream_range
+
+logger = logging.getLogger(__name__)
+
+class VirtualLayout:
+    """
+    A virtual byte view of a Telegram file, served by stream_file like a real file
+    Pieces are (length, origin): origin is an offset into the original file
+    or bytes held in memory
+    """
+    
+    def __init__(self, file_doc: dict, file_size: int, etag: str, pieces: list, content_type: Optional[str] = None):
+        self.file_doc = file_doc
+        self.file_size = file_size
+        self.etag = etag
+        self.content_type = content_type
+        
+        # (virtual_start, length, origin)
+        self.segments = []
+        position = 0
+        
+        for length, origin in pieces:
+            if length > 0:
+                self.segments.append((position, length, origin))
+                position += length
+        
+        self.size = position
+        self.starts = [seg_start for seg_start, _, _ in self.segments]
+    
+    def origin_of(self, position: int) -> Optional[int]:
+        """Offset in the original file behind a virtual byte, or None for in-memory bytes"""
+        seg_start, _, origin = self.segments[max(0, bisect_right(self.starts, position) - 1)]
+        return origin + position - seg_start if isinstance(origin, int) else None
+    
+    async def stream_range(self, source, start: int, end: int):
+        """Yield virtual bytes start..end (inclusive)"""
+        first = max(0, bisect_right(self.starts, start) - 1)
+        
+        for seg_start, length, origin in self.segments[first:]:
+            seg_end = seg_start + length - 1
+            
+            if seg_start > end:
+                break
+            
+            if seg_end < start:
+                continue
+            
+            lo = max(start, seg_start) - seg_start
+            hi = min(end, seg_end) - seg_start
+            
+            if isinstance(origin, int):
+                sent = 0
+                
+                async with aclosing(stream_range(source, self.file_doc, self.file_size, origin + lo, origin + hi, files=True)) as chunks:
+                    async for chunk in chunks:
+                        sent += len(chunk)
+                        yield chunk
+                
+                # A short segment means the original stream gave up; anything after
+                # it would land at the wrong offset, so end the body here
+                if sent < hi - lo + 1:
+                    logger.warning(f"⚠️ Segment at {seg_start} came up short ({sent}/{hi - lo + 1} bytes), ending stream")
+                    return
+            else:
+                yield origin[lo:hi + 1]
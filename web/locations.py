@@ -0,0 +1,132 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Optional
+from pyrogram.errors import FloodWait
+from config import Config
+from bot.services.files import save_current_file_id
+from web.governor import StreamUnavailable
+from web.middleware import init_db
+
+logger = logging.getLogger(__name__)
+
+MAX_LOCATIONS = 10000
+
+class FileLocationCache:
+    """
+    TTL cache of resolved Telegram file locations keyed by the stored file_id
+    A location is what downloads need: the size and the file_id currently carrying
+    a valid reference. A refreshed file_id is also saved on the files document as
+    current_file_id, so it outlives the TTL, restarts and the other workers
+    """
+    
+    def __init__(self):
+        self.ttl = Config.FILE_LOCATION_TTL
+        self.entries = OrderedDict()  # file_id -> location
+        self.refreshing = {}  # file_id -> Task, so one expiry triggers one refresh
+    
+    def get(self, file_id: str) -> Optional[dict]:
+        """Cached location, or None when missing or older than the TTL"""
+        location = self.entries.get(file_id)
+        
+        if location is None:
+            return None
+        
+        if time.monotonic() - location["resolved_at"] > self.ttl:
+            del self.entries[file_id]
+            return None
+        
+        self.entries.move_to_end(file_id)
+        return location
+    
+    def put(self, file_id: str, location: dict):
+        self.entries[file_id] = location
+        self.entries.move_to_end(file_id)
+        
+        while len(self.entries) > MAX_LOCATIONS:
+            self.entries.popitem(last=False)
+    
+    def invalidate(self, file_id: str):
+        self.entries.pop(file_id, None)
+    
+    async def resolve(self, pool, file_doc: dict) -> dict:
+        """Location of a file, looked up at most once per TTL"""
+        file_id = file_doc["file_id"]
+        location = self.get(file_id)
+        
+        if location is None:
+            current_file_id = file_doc.get("current_file_id") or file_id
+            file_size = file_doc.get("file_size") or await self._lookup_size(pool, current_file_id)
+            location = self._location(current_file_id, file_size)
+            self.put(file_id, location)
+        
+        return location
+    
+    async def refresh(self, pool, file_doc: dict) -> dict:
+        """
+        Get a fresh file reference after Telegram reported the old one expired
+        Re-reads the original message, which carries a file_id with a new reference
+        """
+        file_id = file_doc["file_id"]
+        task = self.refreshing.get(file_id)
+        
+        if task is None:
+            task = asyncio.create_task(self._refresh(pool, file_doc))
+            self.refreshing[file_id] = task
+            task.add_done_callback(lambda _: self.refreshing.pop(file_id, None))
+        
+        return await asyncio.shield(task)
+    
+    async def _refresh(self, pool, file_doc: dict) -> dict:
+        file_id = file_doc["file_id"]
+        self.invalidate(file_id)
+        
+        if not file_doc.get("chat_id") or not file_doc.get("message_id"):
+            # Older uploads don't record their message; nothing to refresh from
+            raise RuntimeError(f"No source message to refresh {file_id[:10]}... from")
+        
+        try:
+            async with pool.lease() as stream_client:
+                message = await stream_client.client.get_messages(file_doc["chat_id"], file_doc["message_id"])
+        except FloodWait as e:
+            pool.penalize(stream_client, e.value)
+            raise StreamUnavailable(e.value)
+        
+        media = message and (message.document or message.video or message.audio)
+        
+        if not media:
+            raise RuntimeError(f"Source message of {file_id[:10]}... is gone")
+        
+        location = self._location(media.file_id, media.file_size)
+        self.put(file_id, location)
+        
+        try:
+            await save_current_file_id(await init_db(), file_doc["file_unique_id"], media.file_id)
+        except Exception as e:
+            # Still good in memory; other workers just refresh on their own
+            logger.error(f"❌ Failed to save refreshed file_id for {file_id[:10]}...: {e}")
+        
+        logger.info(f"🔄 File reference refreshed for {file_id[:10]}...")
+        return location
+    
+    async def _lookup_size(self, pool, file_id: str) -> int:
+        """The one upstream round trip, for files stored without a size"""
+        try:
+            async with pool.lease() as stream_client:
+                file_info = await stream_client.client.get_file(file_id)
+        except FloodWait as e:
+            pool.penalize(stream_client, e.value)
+            raise StreamUnavailable(e.value)
+        
+        return file_info.file_size
+    
+    def _location(self, current_file_id: str, file_size: int) -> dict:
+        return {
+            "file_id": current_file_id,
+            "file_size": file_size,
+            "resolved_at": time.monotonic()
+        }
+
+# Global file location cache instance
+file_locations = FileLocationCache()
@@ -0,0 +1,20 @@
+class StreamMetrics:
+    """
+    Per-process counters for where streamed bytes go
+    Wasted bytes were fetched for a response that ended before they could be sent
+    """
+    
+    def __init__(self):
+        self.responses = 0
+        self.disconnects = 0
+        self.delivered_bytes = 0
+        self.wasted_bytes = 0
+        self.upstream_bytes = 0
+        self.file_bytes = 0  # sent straight from cached block files
+        self.cancelled_fetches = 0
+    
+    def snapshot(self) -> dict:
+        return dict(self.__dict__)
+
+# Global stream metrics instance
+stream_metrics = StreamMetrics()
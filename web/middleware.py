@@ -1,10 +1,14 @@
+import asyncio
 import logging
+import math
+import time
 from fastapi import Request, HTTPException
 from fastapi.responses import HTMLResponse
 from motor.motor_asyncio import AsyncIOMotorClient
 from config import Config
-from bot.services.access import verify_access
+from bot.services.access import verify_access, log_access_attempt
 from web.errors import error_page
+from web.workers import take_slot, free_slot
 
 logger = logging.getLogger(__name__)
 
@@ -23,7 +27,115 @@ async def init_db():
     
     return db
 
-async def verify_request(request: Request, token: str, key: str) -> tuple:
+class TooManyConnections(Exception):
+    """A token or IP is over its concurrent connection cap"""
+    
+    def __init__(self, retry_after: float):
+        self.retry_after = max(1, math.ceil(retry_after))
+        super().__init__(f"Too many connections, retry after {self.retry_after}s")
+
+# Other workers can't wake our waiters, so they also re-check this often
+SLOT_POLL_INTERVAL = 0.1  # seconds
+
+class ConnectionLease:
+    """Held by one response for as long as it streams"""
+    
+    def __init__(self, limiter, slots: list):
+        self.limiter = limiter
+        self.slots = slots
+    
+    def release(self):
+        """Give the connection back (safe to call twice)"""
+        if self.slots:
+            self.limiter.release(self.slots)
+            self.slots = []
+
+class ConnectionLimiter:
+    """
+    Concurrent response caps per viewer of a link (token + IP) and per IP, sized by
+    the link's tier; a link shared with many people caps each of them, not all together
+    Requests over a cap wait briefly for a connection to free up, then get a 429
+    Connections are flock slots (web/workers.py), so the caps hold across workers
+    """
+    
+    def __init__(self):
+        self.freed = asyncio.Event()
+    
+    def _caps(self, token: str, client_ip: str, premium: bool) -> list:
+        if premium:
+            per_token, per_ip = Config.PREMIUM_MAX_CONNECTIONS_PER_TOKEN, Config.PREMIUM_MAX_CONNECTIONS_PER_IP
+        else:
+            per_token, per_ip = Config.FREE_MAX_CONNECTIONS_PER_TOKEN, Config.FREE_MAX_CONNECTIONS_PER_IP
+        
+        return [(f"token:{token}:{client_ip}", per_token), (f"ip:{client_ip}", per_ip)]
+    
+    def _try_acquire(self, caps: list):
+        """A slot under every cap (0 = no cap), or None without holding any"""
+        slots = []
+        
+        for key, cap in caps:
+            if cap <= 0:
+                continue
+            
+            slot = take_slot(key, cap)
+            
+            if slot is None:
+                self.release(slots)
+                return None
+            
+            slots.append(slot)
+        
+        return slots
+    
+    async def acquire(self, token: str, client_ip: str, premium: bool) -> ConnectionLease:
+        """Take a connection under every cap, waiting up to CONNECTION_QUEUE_WAIT"""
+        caps = self._caps(token, client_ip, premium)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + Config.CONNECTION_QUEUE_WAIT
+        
+        while True:
+            slots = self._try_acquire(caps)
+            
+            if slots is not None:
+                return ConnectionLease(self, slots)
+            
+            remaining = deadline - loop.time()
+            
+            if remaining <= 0:
+                raise TooManyConnections(Config.CONNECTION_QUEUE_WAIT)
+            
+            try:
+                await asyncio.wait_for(self.freed.wait(), min(remaining, SLOT_POLL_INTERVAL))
+            except asyncio.TimeoutError:
+                pass
+    
+    def release(self, slots: list):
+        for slot in slots:
+            free_slot(slot)
+        
+        # Wake this worker's waiters to re-check their caps
+        self.freed.set()
+        self.freed = asyncio.Event()
+
+# Global connection limiter instance
+connection_limiter = ConnectionLimiter()
+
+def client_ip(request: Request) -> str:
+    """Viewer's IP, taken from the proxy's X-Forwarded-For entry when behind one"""
+    if Config.TRUST_PROXY_HEADERS:
+        forwarded = request.headers.get("x-forwarded-for")
+        
+        # The last hop is the one our own proxy appended; earlier ones are client-supplied
+        if forwarded:
+            return forwarded.split(",")[-1].strip()
+    
+    return request.client.host if request.client else "unknown"
+
+async def limit_connection(request: Request, token: str, token_data: dict) -> ConnectionLease:
+    """Hold a connection slot for this viewer of the token and their IP, or raise TooManyConnections"""
+    return await connection_limiter.acquire(token, client_ip(request), bool(token_data.get("is_premium")))
+
+async def verify_request(request: Request, token: str, key: str, count_access: bool = True) -> tuple:
     """
     Verify request token and key
     Returns: (success, token_data, error_type)
@@ -33,25 +145,36 @@ async def verify_request(request: Request, token: str, key: str) -> tuple:
         db = await init_db()
         
         # Extract client IP
-        client_ip = request.client.host if request.client else "unknown"
+        ip_address = client_ip(request)
+        started = time.monotonic()
         
         # Verify access
-        success, token_data, error = await verify_access(db, token, key)
+        success, token_data, error = await verify_access(db, token, key, count_access)
+        
+        await log_access_attempt(
+            db,
+            token,
+            (token_data or {}).get("user_id"),
+            ip_address,
+            success,
+            error,
+            latency_ms=round((time.monotonic() - started) * 1000, 2)
+        )
         
         if not success:
-            logger.warning(f"⚠️ Access denied from {client_ip}: {error}")
+            logger.warning(f"⚠️ Access denied from {ip_address}: {error}")
             return False, None, error
         
-        logger.info(f"✅ Access granted from {client_ip} for token {token[:10]}...")
+        logger.info(f"✅ Access granted from {ip_address} for token {token[:10]}...")
         return True, token_data, None
     
     except Exception as e:
         logger.error(f"❌ Request verification failed BC: {e}")
         return False, None, "server_error"
 
-async def handle_error(error_type: str) -> HTMLResponse:
+async def handle_error(error_type: str, status_code: int = 403, headers: dict = None) -> HTMLResponse:
     """Handle and return error page"""
-    return error_page(error_type, "Access denied")
+    return error_page(error_type, "Access denied", status_code=status_code, headers=headers)
 
 async def get_db():
     """Get database instance"""
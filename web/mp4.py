@@ -0,0 +1,246 @@
+import struct
+
+# Minimal ISO-BMFF (MP4/MOV) parsing: just enough of moov to find every sample
+
+class MP4Error(Exception):
+    """The file is not a usable MP4"""
+
+# What truncated or corrupt tables raise while being read; reported as MP4Error
+MALFORMED = (struct.error, IndexError, UnicodeDecodeError)
+
+def parse_box_header(data: bytes, pos: int) -> tuple:
+    """
+    Read a box header at pos
+    Returns: (box_type, box_size, header_size); box_size 0 means "to end of file"
+    """
+    if len(data) - pos < 8:
+        raise MP4Error("Truncated box header")
+    
+    size, box_type = struct.unpack_from(">I4s", data, pos)
+    header_size = 8
+    
+    if size == 1:
+        if len(data) - pos < 16:
+            raise MP4Error("Truncated 64-bit box header")
+        
+        size = struct.unpack_from(">Q", data, pos + 8)[0]
+        header_size = 16
+    
+    elif size != 0 and size < 8:
+        raise MP4Error(f"Invalid size {size} for box {box_type!r}")
+    
+    return box_type, size, header_size
+
+def build_box(box_type: bytes, payload: bytes) -> bytes:
+    """Serialize a box, switching to a 64-bit size when needed"""
+    size = len(payload) + 8
+    
+    if size <= 0xFFFFFFFF:
+        return struct.pack(">I4s", size, box_type) + payload
+    
+    return struct.pack(">I4sQ", 1, box_type, size + 8) + payload
+
+def build_full_box(box_type: bytes, version: int, flags: int, payload: bytes) -> bytes:
+    """Serialize a full box (version + 24-bit flags)"""
+    return build_box(box_type, struct.pack(">I", (version << 24) | flags) + payload)
+
+def iter_boxes(data: bytes, start: int, end: int):
+    """Yield (box_type, box_start, payload_start, box_end) for boxes in data[start:end]"""
+    pos = start
+    
+    while pos + 8 <= end:
+        box_type, size, header_size = parse_box_header(data, pos)
+        box_end = end if size == 0 else pos + size
+        
+        if box_end > end:
+            raise MP4Error(f"Box {box_type!r} overruns its parent")
+        
+        yield box_type, pos, pos + header_size, box_end
+        pos = box_end
+
+def find_box(data: bytes, start: int, end: int, box_type: bytes):
+    """First child box of the given type, or None"""
+    for child_type, box_start, payload, box_end in iter_boxes(data, start, end):
+        if child_type == box_type:
+            return box_start, payload, box_end
+    
+    return None
+
+def _full_box(data: bytes, payload: int) -> tuple:
+    """(version, body_start) of a full box"""
+    return data[payload], payload + 4
+
+def _parse_table(data: bytes, payload: int, fmt: str) -> list:
+    _, pos = _full_box(data, payload)
+    count = struct.unpack_from(">I", data, pos)[0]
+    width = struct.calcsize(">" + fmt)
+    rows = []
+    pos += 4
+    
+    for _ in range(count):
+        rows.append(struct.unpack_from(">" + fmt, data, pos))
+        pos += width
+    
+    return rows
+
+def _parse_stsz(data: bytes, payload: int) -> list:
+    _, pos = _full_box(data, payload)
+    sample_size, count = struct.unpack_from(">II", data, pos)
+    
+    if sample_size:
+        return [sample_size] * count
+    
+    return list(struct.unpack_from(f">{count}I", data, pos + 8))
+
+def _parse_chunk_offsets(data: bytes, box_type: bytes, payload: int) -> list:
+    _, pos = _full_box(data, payload)
+    count = struct.unpack_from(">I", data, pos)[0]
+    fmt = "Q" if box_type == b"co64" else "I"
+    return list(struct.unpack_from(f">{count}{fmt}", data, pos + 4))
+
+def _parse_ctts(data: bytes, payload: int) -> list:
+    """Per-run (count, offset) rows; version 1 offsets are signed"""
+    version, _ = _full_box(data, payload)
+    return _parse_table(data, payload, "Ii" if version == 1 else "II")
+
+def _parse_mdhd(data: bytes, payload: int) -> tuple:
+    version, pos = _full_box(data, payload)
+    
+    if version == 1:
+        timescale, duration = struct.unpack_from(">IQ", data, pos + 16)
+    else:
+        timescale, duration = struct.unpack_from(">II", data, pos + 8)
+    
+    return timescale, duration
+
+def parse_track(data: bytes, trak_payload: int, trak_end: int) -> dict:
+    """Sample layout of one trak box"""
+    track = {"track_id": None, "handler": None, "codec": None}
+    
+    tkhd = find_box(data, trak_payload, trak_end, b"tkhd")
+    
+    if tkhd:
+        version, pos = _full_box(data, tkhd[1])
+        track["track_id"] = struct.unpack_from(">I", data, pos + (16 if version == 1 else 8))[0]
+    
+    mdia = find_box(data, trak_payload, trak_end, b"mdia")
+    
+    if not mdia:
+        raise MP4Error("Track without mdia")
+    
+    mdhd = find_box(data, mdia[1], mdia[2], b"mdhd")
+    track["timescale"], track["duration"] = _parse_mdhd(data, mdhd[1]) if mdhd else (1, 0)
+    
+    hdlr = find_box(data, mdia[1], mdia[2], b"hdlr")
+    
+    if hdlr:
+        track["handler"] = data[hdlr[1] + 8:hdlr[1] + 12].decode("latin-1")
+    
+    minf = find_box(data, mdia[1], mdia[2], b"minf")
+    stbl = find_box(data, minf[1], minf[2], b"stbl") if minf else None
+    
+    if not stbl:
+        raise MP4Error("Track without sample table")
+    
+    tables = {}
+    chunk_offset_box = None
+    
+    for box_type, box_start, payload, box_end in iter_boxes(data, stbl[1], stbl[2]):
+        if box_type == b"stsd":
+            # First sample entry's fourcc
+            track["codec"] = data[payload + 12:payload + 16].decode("latin-1")
+        elif box_type == b"stts":
+            tables["stts"] = _parse_table(data, payload, "II")
+        elif box_type == b"ctts":
+            tables["ctts"] = _parse_ctts(data, payload)
+        elif box_type == b"stss":
+            tables["stss"] = [row[0] for row in _parse_table(data, payload, "I")]
+        elif box_type == b"stsc":
+            tables["stsc"] = _parse_table(data, payload, "III")
+        elif box_type == b"stsz":
+            tables["stsz"] = _parse_stsz(data, payload)
+        elif box_type in (b"stco", b"co64"):
+            tables["chunk_offsets"] = _parse_chunk_offsets(data, box_type, payload)
+            chunk_offset_box = (box_type, box_start, payload, box_end)
+    
+    sizes = tables.get("stsz", [])
+    chunk_offsets = tables.get("chunk_offsets", [])
+    stsc = tables.get("stsc", [])
+    
+    # Sample byte offsets: walk chunks, using stsc runs for samples per chunk
+    offsets = []
+    sample = 0
+    
+    for i, (first_chunk, samples_per_chunk, _) in enumerate(stsc):
+        last_chunk = stsc[i + 1][0] - 1 if i + 1 < len(stsc) else len(chunk_offsets)
+        
+        for chunk in range(first_chunk - 1, min(last_chunk, len(chunk_offsets))):
+            offset = chunk_offsets[chunk]
+            
+            for _ in range(samples_per_chunk):
+                if sample >= len(sizes):
+                    break
+                
+                offsets.append(offset)
+                offset += sizes[sample]
+                sample += 1
+    
+    # Sample decode times from stts runs
+    times = []
+    clock = 0
+    
+    for count, delta in tables.get("stts", []):
+        for _ in range(count):
+            times.append(clock)
+            clock += delta
+    
+    count = min(len(offsets), len(sizes), len(times)) if times else min(len(offsets), len(sizes))
+    
+    track["sample_sizes"] = sizes[:count]
+    track["sample_offsets"] = offsets[:count]
+    track["sample_times"] = times[:count] if times else [0] * count
+    
+    # Composition offsets from ctts runs (None when decode order == presentation order)
+    if "ctts" in tables:
+        composition = []
+        
+        for run, offset in tables["ctts"]:
+            composition.extend([offset] * run)
+        
+        composition += [0] * (count - len(composition))
+        track["composition_offsets"] = composition[:count]
+    else:
+        track["composition_offsets"] = None
+    
+    # Sync samples (1-based in stss); no stss means every sample is a keyframe
+    if "stss" in tables:
+        track["sync_samples"] = [n - 1 for n in tables["stss"] if 0 < n <= count]
+    else:
+        track["sync_samples"] = list(range(count))
+    
+    track["chunk_offset_box"] = chunk_offset_box
+    return track
+
+def parse_moov(data: bytes) -> dict:
+    """
+    Parse a complete moov box (data starts at the moov header)
+    Returns: {"timescale", "duration", "tracks": [...]}
+    """
+    box_type, size, header_size = parse_box_header(data, 0)
+    
+    if box_type != b"moov":
+        raise MP4Error("Not a moov box")
+    
+    end = size or len(data)
+    movie = {"timescale": 1, "duration": 0, "tracks": []}
+    
+    try:
+        for child_type, _, payload, child_end in iter_boxes(data, header_size, end):
+            if child_type == b"mvhd":
+                movie["timescale"], movie["duration"] = _parse_mdhd(data, payload)
+            elif child_type == b"trak":
+                movie["tracks"].append(parse_track(data, payload, child_end))
+    except MALFORMED as e:
+        raise MP4Error(f"Malformed moov: {e}")
+    
+    return movie
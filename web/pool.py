@@ -0,0 +1,179 @@
+import asyncio
+import itertools
+import logging
+import time
+from contextlib import asynccontextmanager
+from pyrogram import Client
+from pyrogram.errors import FloodWait
+from config import Config
+from web.governor import TokenBucket, StreamUnavailable
+
+logger = logging.getLogger(__name__)
+
+HEALTH_CHECK_INTERVAL = 60  # seconds
+
+class StreamClient:
+    """One Telegram session in the stream pool"""
+    
+    def __init__(self, name: str, client: Client, account: str):
+        self.name = name
+        self.client = client
+        self.account = account  # bot the session logs in as; Telegram's FloodWait is per account
+        self.inflight = 0
+        self.penalized_until = 0.0
+        self.healthy = True
+        self.bucket = TokenBucket()
+    
+    def ready_in(self) -> float:
+        """Seconds until this client may send its next request"""
+        penalty = max(0.0, self.penalized_until - time.monotonic())
+        return max(penalty, self.bucket.wait_time())
+
+class StreamClientPool:
+    """
+    Pool of Telegram sessions used by the web streamer
+    Picks a client per fetch (least-loaded or round-robin) among those whose
+    token bucket allows a request, and takes clients out of rotation while they
+    are FloodWait-penalized or failing health checks
+    Every session logs in with BOT_TOKEN, so they spread load and connections but
+    share one flood limit: a FloodWait takes all of them out together
+    """
+    
+    def __init__(self):
+        self.clients = []
+        self.policy = Config.STREAM_POOL_POLICY
+        self.rotation = itertools.count()
+        self.health_task = None
+    
+    async def start(self, worker_id: int = 0):
+        """Start every configured session"""
+        if self.clients:
+            return
+        
+        for i in range(max(1, Config.STREAM_SESSIONS)):
+            # Unique per worker so parallel uvicorn workers never share a session
+            name = f"web_streamer_w{worker_id}_{i}"
+            client = Client(
+                name,
+                api_id=Config.API_ID,
+                api_hash=Config.API_HASH,
+                bot_token=Config.BOT_TOKEN,
+                in_memory=True
+            )
+            
+            try:
+                await client.start()
+                self.clients.append(StreamClient(name, client, Config.BOT_TOKEN.split(":")[0]))
+            except Exception as e:
+                logger.error(f"❌ Failed to start stream client {name}: {e}")
+        
+        if not self.clients:
+            raise RuntimeError("No stream client could be started BC!")
+        
+        self.health_task = asyncio.create_task(self._health_loop())
+        logger.info(f"✅ Stream pool initialized with {len(self.clients)} clients")
+    
+    async def stop(self):
+        """Stop every session"""
+        if self.health_task:
+            self.health_task.cancel()
+        
+        for stream_client in self.clients:
+            try:
+                await stream_client.client.stop()
+            except:
+                pass
+        
+        self.clients = []
+        logger.info("🛑 Stream pool stopped")
+    
+    def pick(self) -> tuple:
+        """
+        Choose a client according to the pool policy
+        Returns: (client, seconds until it is ready)
+        """
+        healthy = [c for c in self.clients if c.healthy] or self.clients
+        waits = [(c, c.ready_in()) for c in healthy]
+        ready = [c for c, wait in waits if wait == 0]
+        
+        if not ready:
+            return min(waits, key=lambda item: item[1])
+        
+        if self.policy == "round_robin":
+            return ready[next(self.rotation) % len(ready)], 0.0
+        
+        # Least loaded, round-robin between ties
+        lowest = min(c.inflight for c in ready)
+        candidates = [c for c in ready if c.inflight == lowest]
+        return candidates[next(self.rotation) % len(candidates)], 0.0
+    
+    def idle(self) -> bool:
+        """No fetch in flight and a client free to take one (background work may go ahead)"""
+        return all(c.inflight == 0 for c in self.clients) and any(c.ready_in() == 0 for c in self.clients)
+    
+    @asynccontextmanager
+    async def lease(self, max_wait: float = None):
+        """
+        Borrow a client for one upstream call
+        Raises StreamUnavailable instead of waiting longer than max_wait
+        """
+        if max_wait is None:
+            max_wait = Config.STREAM_MAX_WAIT
+        
+        deadline = time.monotonic() + max_wait
+        stream_client, wait = self.pick()
+        
+        while wait > 0:
+            if time.monotonic() + wait > deadline:
+                raise StreamUnavailable(wait)
+            
+            await asyncio.sleep(wait)
+            stream_client, wait = self.pick()
+        
+        stream_client.bucket.consume()
+        stream_client.inflight += 1
+        
+        try:
+            yield stream_client
+        finally:
+            stream_client.inflight -= 1
+    
+    def penalize(self, stream_client: StreamClient, seconds: float):
+        """
+        Take a client out of rotation for a FloodWait, along with every session on
+        the same account, so the request isn't simply retried on a sibling
+        """
+        until = time.monotonic() + seconds
+        
+        for sibling in self.clients:
+            if sibling is stream_client or sibling.account == stream_client.account:
+                sibling.penalized_until = max(sibling.penalized_until, until)
+                sibling.bucket.on_flood()
+        
+        logger.warning(f"⚠️ {stream_client.name} FloodWait {seconds}s, account {stream_client.account} out of rotation")
+    
+    async def _health_loop(self):
+        """Ping every client and pull unhealthy ones out of rotation"""
+        while True:
+            await asyncio.sleep(HEALTH_CHECK_INTERVAL)
+            
+            for stream_client in self.clients:
+                try:
+                    await stream_client.client.get_me()
+                    
+                    if not stream_client.healthy:
+                        logger.info(f"✅ {stream_client.name} healthy again")
+                    
+                    stream_client.healthy = True
+                
+                except FloodWait as e:
+                    self.penalize(stream_client, e.value)
+                
+                except Exception as e:
+                    if stream_client.healthy:
+                        logger.error(f"❌ {stream_client.name} failed health check: {e}")
+                    
+                    stream_client.healthy = False
+
+# Global stream pool instance
+stream_pool = StreamClientPool()
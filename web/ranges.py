@@ -0,0 +1,145 @@
+import secrets
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+# RFC 7233 byte ranges
+
+MAX_RANGES = 16  # more parts than this get merged into one span
+
+class RangeNotSatisfiable(Exception):
+    """None of the requested ranges overlap the file"""
+
+def parse_range(header: str, file_size: int) -> Optional[list]:
+    """
+    Parse a Range header into sorted, merged inclusive (start, end) pairs
+    Returns None when the header should be ignored (missing, not bytes, malformed)
+    Raises RangeNotSatisfiable when it is valid but nothing overlaps the file
+    """
+    if not header:
+        return None
+    
+    unit, _, spec = header.partition("=")
+    
+    if unit.strip().lower() != "bytes" or not spec.strip():
+        return None
+    
+    ranges = []
+    
+    for part in spec.split(","):
+        part = part.strip()
+        
+        if not part:
+            continue
+        
+        first, dash, last = part.partition("-")
+        first, last = first.strip(), last.strip()
+        
+        if not dash or (first and not first.isdigit()) or (last and not last.isdigit()):
+            return None
+        
+        if not first:
+            # Suffix range: the last N bytes
+            if not last:
+                return None
+            
+            length = int(last)
+            
+            if length == 0 or file_size == 0:
+                continue
+            
+            ranges.append((max(0, file_size - length), file_size - 1))
+            continue
+        
+        start = int(first)
+        
+        if last and int(last) < start:
+            return None
+        
+        if start >= file_size:
+            continue
+        
+        end = min(int(last), file_size - 1) if last else file_size - 1
+        ranges.append((start, end))
+    
+    if not ranges:
+        raise RangeNotSatisfiable()
+    
+    # Merge overlapping and adjacent ranges
+    ranges.sort()
+    merged = [ranges[0]]
+    
+    for start, end in ranges[1:]:
+        last_start, last_end = merged[-1]
+        
+        if start <= last_end + 1:
+            merged[-1] = (last_start, max(last_end, end))
+        else:
+            merged.append((start, end))
+    
+    if len(merged) > MAX_RANGES:
+        merged = [(merged[0][0], max(end for _, end in merged))]
+    
+    return merged
+
+def starts_playback(header: str) -> bool:
+    """No Range, or one from byte 0: a player opening the file rather than seeking in it"""
+    if not header:
+        return True
+    
+    unit, _, spec = header.partition("=")
+    first = spec.split(",")[0].partition("-")[0].strip()
+    return unit.strip().lower() == "bytes" and first == "0"
+
+def if_range_matches(if_range: str, etag: str, last_modified: Optional[datetime]) -> bool:
+    """
+    Check an If-Range validator against the current representation
+    Only a strong ETag or an exact Last-Modified date counts as a match
+    """
+    if not if_range:
+        return True
+    
+    if_range = if_range.strip()
+    
+    if if_range.startswith('"') or if_range.startswith("W/"):
+        return if_range == etag
+    
+    if last_modified is None:
+        return False
+    
+    try:
+        since = parsedate_to_datetime(if_range)
+    except (TypeError, ValueError):
+        return False
+    
+    return since.replace(tzinfo=None) == last_modified.replace(microsecond=0, tzinfo=None)
+
+def content_range(start: int, end: int, file_size: int) -> str:
+    """Content-Range value for one part"""
+    return f"bytes {start}-{end}/{file_size}"
+
+def multipart_boundary() -> str:
+    """Random boundary for multipart/byteranges bodies"""
+    return secrets.token_hex(16)
+
+def multipart_part_header(boundary: str, content_type: str, start: int, end: int, file_size: int) -> bytes:
+    """Delimiter and headers that precede one part"""
+    return (
+        f"\r\n--{boundary}\r\n"
+        f"Content-Type: {content_type}\r\n"
+        f"Content-Range: {content_range(start, end, file_size)}\r\n\r\n"
+    ).encode()
+
+def multipart_trailer(boundary: str) -> bytes:
+    """Closing delimiter of a multipart/byteranges body"""
+    return f"\r\n--{boundary}--\r\n".encode()
+
+def multipart_length(boundary: str, content_type: str, ranges: list, file_size: int) -> int:
+    """Exact Content-Length of a multipart/byteranges body"""
+    total = len(multipart_trailer(boundary))
+    
+    for start, end in ranges:
+        total += len(multipart_part_header(boundary, content_type, start, end, file_size))
+        total += end - start + 1
+    
+    return total
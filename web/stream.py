@@ -1,135 +1,447 @@
 import logging
+from collections import deque
 from io import BytesIO
-from pyrogram import Client
-from pyrogram.errors import FloodWait
 from fastapi import Request
-from fastapi.responses import StreamingResponse
+from fastapi.responses import Response, StreamingResponse
+from starlette.background import BackgroundTask
 import asyncio
+import os
+import time
+from contextlib import aclosing
+from itertools import groupby
 from config import Config
+from bot.services.access_log import access_log
+from web.conditional import validator_headers, not_modified
+from web.blocks import BLOCK_SIZE, block_length, blocks_for_range
+from web.disk_cache import FileSlice
+from web.egress import egress
+from web.fetch import LocalBlockSource
+from web.fetcher import FetcherClient
+from web.governor import StreamUnavailable
+from web.metrics import stream_metrics
+from web.middleware import client_ip
+from web.ranges import (
+    RangeNotSatisfiable, parse_range, if_range_matches, content_range,
+    multipart_boundary, multipart_part_header, multipart_trailer, multipart_length
+)
+from web.workers import claim_worker_id, connection_slots
 
 logger = logging.getLogger(__name__)
 
-# Global Pyrogram client for file streaming
-stream_client = None
+# Where blocks come from: this process, or the shared fetcher daemon
+block_source = None
 
 async def init_stream_client():
-    """Initialize Pyrogram client for streaming"""
-    global stream_client
-    
-    if stream_client is None:
-        stream_client = Client(
-            "web_streamer",
-            api_id=Config.API_ID,
-            api_hash=Config.API_HASH,
-            bot_token=Config.BOT_TOKEN,
-            in_memory=True
-        )
-        await stream_client.start()
-        logger.info("✅ Stream client initialized")
+    """Initialize the block source for streaming"""
+    global block_source
+    
+    if block_source is None:
+        if Config.FETCHER_SOCKET:
+            source = FetcherClient(Config.FETCHER_SOCKET)
+            await source.start()
+        else:
+            # Split the disk cache between workers only when there are several
+            source = LocalBlockSource()
+            await source.start(claim_worker_id() if Config.WEB_CONCURRENCY > 1 else None)
+        
+        block_source = source
+    
+    return block_source
+
+async def prefetch_blocks(source, file_doc: dict, file_size: int, indexes: list):
+    """Yield blocks in order while keeping several downloads in flight"""
+    max_in_flight = max(1, Config.STREAM_PREFETCH_CHUNKS)
+    max_buffered = Config.STREAM_PREFETCH_MAX_BYTES
+    
+    pending = deque()
+    buffered = 0
+    next_index = 0
+    
+    try:
+        while True:
+            # Keep the pipeline full without exceeding the buffer cap
+            while next_index < len(indexes) and len(pending) < max_in_flight:
+                index = indexes[next_index]
+                limit = block_length(index, file_size)
+                
+                if pending and buffered + limit > max_buffered:
+                    break
+                
+                task = asyncio.create_task(
+                    source.block(file_doc, file_size, index)
+                )
+                pending.append((task, limit))
+                buffered += limit
+                next_index += 1
+            
+            if not pending:
+                break
+            
+            task, limit = pending.popleft()
+            
+            try:
+                chunk = await task
+            except StreamUnavailable as e:
+                logger.warning(f"⚠️ Stream clients busy, ending response early: {e}")
+                break
+            except Exception as e:
+                logger.error(f"❌ Streaming error: {e}")
+                break
+            
+            buffered -= limit
+            
+            if not chunk:
+                break
+            
+            yield chunk
     
-    return stream_client
+    finally:
+        # Drop fetches nobody will read; blocks that already arrived count as waste
+        for task, _ in pending:
+            if not task.done():
+                task.cancel()
+            elif not task.cancelled() and task.exception() is None:
+                stream_metrics.wasted_bytes += len(task.result() or b"")
 
-async def stream_file(file_id: str, request: Request):
+class BlockStreamingResponse(StreamingResponse):
     """
-    Stream file from Telegram with range request support
+    StreamingResponse that can also send FileSlice chunks
+    A slice is read from its block file in a thread just before it is sent, so
+    cached blocks never sit in memory waiting for a slow client
     """
-    try:
-        client = await init_stream_client()
+    
+    async def stream_response(self, send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
         
-        # Get file info
+        async for chunk in self.body_iterator:
+            if isinstance(chunk, FileSlice):
+                stream_metrics.file_bytes += len(chunk)
+                chunk = await asyncio.to_thread(chunk.read)
+            
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+class ClientDisconnected(Exception):
+    """The client went away mid-response"""
+
+def entity_tag(file_doc: dict) -> str:
+    """Strong ETag for a file's bytes"""
+    return f'"{file_doc["file_unique_id"]}"'
+
+async def fetch_run(source, file_doc: dict, file_size: int, blocks: list):
+    """Yield the trimmed bytes of consecutive blocks, fetched through the prefetch pipeline"""
+    indexes = [index for index, _, _ in blocks]
+    trims = iter(blocks)
+    
+    async with aclosing(prefetch_blocks(source, file_doc, file_size, indexes)) as fetched:
+        async for block in fetched:
+            _, skip, take = next(trims)
+            chunk = block[skip:skip + take]
+            
+            if not chunk:
+                break
+            
+            yield chunk
+
+async def stream_range(source, file_doc: dict, file_size: int, start: int, end: int, files: bool = False):
+    """
+    Yield the bytes of one inclusive range
+    files: yield a FileSlice for every block already cached on disk, so only the
+    uncached parts go through Python
+    """
+    # Fetch whole aligned blocks and trim the edges to the range
+    blocks = blocks_for_range(start, end)
+    paths = {}
+    
+    if files:
         try:
-            file_info = await client.get_file(file_id)
+            paths = await source.cached_paths(file_doc, [index for index, _, _ in blocks])
         except Exception as e:
-            logger.error(f"❌ Failed to get file info: {e}")
-            raise
+            logger.warning(f"⚠️ Cached block lookup failed: {e}")
+    
+    for cached, run in groupby(blocks, key=lambda block: block[0] in paths):
+        run = list(run)
         
-        file_size = file_info.file_size
+        if cached:
+            # Send straight from the block files; from the first one evicted since the lookup on, fetch instead
+            missing = []
+            
+            for position, (index, skip, take) in enumerate(run):
+                try:
+                    fd = os.open(paths[index], os.O_RDONLY)
+                except FileNotFoundError:
+                    missing = run[position:]
+                    break
+                
+                try:
+                    yield FileSlice(fd, skip, take)
+                finally:
+                    os.close(fd)
+            
+            run = missing
         
-        # Parse range header
-        range_header = request.headers.get("range")
+        if not run:
+            continue
         
-        if range_header:
-            # Range request
-            range_match = range_header.replace("bytes=", "").split("-")
-            start = int(range_match[0]) if range_match[0] else 0
-            end = int(range_match[1]) if len(range_match) > 1 and range_match[1] else file_size - 1
+        expected = sum(take for _, _, take in run)
+        sent = 0
+        
+        async with aclosing(fetch_run(source, file_doc, file_size, run)) as chunks:
+            async for chunk in chunks:
+                sent += len(chunk)
+                yield chunk
+        
+        # A short run means the stream is over; later blocks would land at the wrong offset
+        if sent < expected:
+            return
+
+async def ensure_first_block(source, file_doc: dict, file_size: int, offset: int):
+    """
+    Fetch the block a response starts with before any header goes out
+    Raises StreamUnavailable while no session can serve it, so the client gets a
+    503 with Retry-After instead of 200/206 headers and a truncated body
+    """
+    index = offset // BLOCK_SIZE
+    
+    if index in await source.cached_paths(file_doc, [index]):
+        return
+    
+    # Kept by the memory cache, so the response body picks it up from there
+    await source.block(file_doc, file_size, index)
+
+async def read_range(source, file_doc: dict, file_size: int, start: int, end: int) -> bytes:
+    """Read one inclusive range into memory"""
+    data = b"".join([chunk async for chunk in stream_range(source, file_doc, file_size, start, end)])
+    
+    if len(data) != end - start + 1:
+        raise IOError(f"Short read: got {len(data)} of {end - start + 1} bytes")
+    
+    return data
+
+async def stream_file(file_doc: dict, request: Request, layout=None, token_data: dict = None, lease=None, final: bool = True):
+    """
+    Stream file from Telegram with range request support
+    HEAD requests get the same headers without touching Telegram
+    layout: optional virtual byte layout (e.g. faststart MP4) to serve instead of the raw file
+    token_data: the link being served; its expiry bounds the cache lifetime and its tier the uplink share
+    lease: per-token/IP connection lease, held until the response body is done
+    final: False when the same URL may later serve a different layout (no immutable caching)
+    """
+    streaming = False
+    started = time.monotonic()
+    
+    try:
+        source = await init_stream_client()
+        etag = layout.etag if layout else entity_tag(file_doc)
+        # A virtual layout can change under the same upload (e.g. once indexed), so it's validated by ETag only
+        last_modified = None if layout else file_doc.get("upload_time")
+        validators = validator_headers(etag, last_modified, token_data, final)
+        
+        # Conditional requests are answered before anything touches Telegram
+        if not_modified(request.headers, etag, last_modified):
+            return Response(status_code=304, headers=validators)
+        
+        if layout:
+            file_size = layout.size
+            read = lambda start, end: layout.stream_range(source, start, end)
         else:
+            # Size comes from the stored file document; ask Telegram only if it's missing
+            file_size = file_doc.get("file_size") or await source.file_size(file_doc)
+            read = lambda start, end: stream_range(source, file_doc, file_size, start, end, files=True)
+        
+        # Determine content type
+        content_type = getattr(layout, "content_type", None) or file_doc.get("mime_type") or "application/octet-stream"
+        
+        # Parse range header (If-Range falls back to the full file when the validator changed)
+        try:
+            ranges = parse_range(request.headers.get("range"), file_size)
+        except RangeNotSatisfiable:
+            return Response(
+                status_code=416,
+                headers={"Accept-Ranges": "bytes", "Content-Range": f"bytes */{file_size}", **validators}
+            )
+        
+        if ranges and not if_range_matches(request.headers.get("if-range"), etag, last_modified):
+            ranges = None
+        
+        # Build headers
+        headers = {
+            "Accept-Ranges": "bytes",
+            **validators
+        }
+        
+        if not ranges:
             # Full file
-            start = 0
-            end = file_size - 1
+            ranges = [(0, file_size - 1)]
+            headers["Content-Length"] = str(file_size)
+            headers["Content-Type"] = content_type
+            status_code = 200
+        elif len(ranges) == 1:
+            start, end = ranges[0]
+            headers["Content-Length"] = str(end - start + 1)
+            headers["Content-Type"] = content_type
+            headers["Content-Range"] = content_range(start, end, file_size)
+            status_code = 206  # Partial Content
+        else:
+            boundary = multipart_boundary()
+            headers["Content-Length"] = str(multipart_length(boundary, content_type, ranges, file_size))
+            headers["Content-Type"] = f"multipart/byteranges; boundary={boundary}"
+            status_code = 206  # Partial Content
         
-        # Calculate chunk size
-        chunk_size = min(1024 * 1024, end - start + 1)  # 1MB chunks
+        # HEAD probes are answered from metadata alone
+        if request.method == "HEAD":
+            return Response(status_code=status_code, headers=headers)
         
-        async def file_streamer():
-            """Generator for streaming file chunks"""
-            try:
-                offset = start
-                
-                while offset <= end:
-                    try:
-                        # Calculate current chunk size
-                        current_chunk_size = min(chunk_size, end - offset + 1)
+        # Commit to 200/206 only once a session has actually served the start
+        if layout:
+            origin = layout.origin_of(ranges[0][0])
+            
+            if origin is not None:
+                await ensure_first_block(source, file_doc, layout.file_size, origin)
+        else:
+            await ensure_first_block(source, file_doc, file_size, ranges[0][0])
+        
+        # Shared cap on concurrent responses across all workers
+        slot = connection_slots.acquire()
+        
+        if slot is None:
+            raise StreamUnavailable(1)
+        
+        def finish():
+            connection_slots.release(slot)
+            
+            if lease:
+                lease.release()
+        
+        # Uplink share follows the link's tier; one viewer's parallel connections to a
+        # link share it, while a link shared around gets a flow per viewer
+        token_data = token_data or {}
+        flow_key = (token_data["token"], client_ip(request)) if token_data.get("token") else None
+        flow = egress.flow(bool(token_data.get("is_premium")), flow_key)
+        
+        # For the access log
+        served = 0
+        first_byte_at = None
+        
+        async def send(start: int, end: int):
+            """Yield one range, stopping as soon as the client has gone away"""
+            nonlocal served, first_byte_at
+            
+            async with aclosing(read(start, end)) as chunks:
+                async for chunk in chunks:
+                    left = len(chunk)
+                    
+                    for piece in egress.pieces(chunk):
+                        if await request.is_disconnected():
+                            stream_metrics.wasted_bytes += left
+                            raise ClientDisconnected()
                         
-                        # Download chunk
-                        chunk = await client.download(
-                            file_id,
-                            file_size=file_size,
-                            offset=offset,
-                            limit=current_chunk_size
-                        )
+                        left -= len(piece)
                         
-                        if not chunk:
-                            break
+                        await egress.send(flow, len(piece))
                         
-                        yield chunk
-                        offset += len(chunk)
+                        stream_metrics.delivered_bytes += len(piece)
+                        served += len(piece)
+                        first_byte_at = first_byte_at or time.monotonic()
+                        yield piece
+        
+        async def file_streamer():
+            """Generator for streaming file chunks"""
+            stream_metrics.responses += 1
+            outcome = "complete"
+            
+            try:
+                if len(ranges) == 1:
+                    start, end = ranges[0]
+                    
+                    async with aclosing(send(start, end)) as chunks:
+                        async for chunk in chunks:
+                            yield chunk
                     
-                    except FloodWait as e:
-                        logger.warning(f"FloodWait: {e.value} seconds")
-                        await asyncio.sleep(e.value)
+                    return
+                
+                for start, end in ranges:
+                    yield multipart_part_header(boundary, content_type, start, end, file_size)
                     
-                    except Exception as e:
-                        logger.error(f"❌ Streaming error: {e}")
-                        break
+                    async with aclosing(send(start, end)) as chunks:
+                        async for chunk in chunks:
+                            yield chunk
+                
+                yield multipart_trailer(boundary)
+            
+            except ClientDisconnected:
+                stream_metrics.disconnects += 1
+                outcome = "disconnected"
+            
+            except asyncio.CancelledError:
+                # Starlette cancels the response when it sees the disconnect first
+                stream_metrics.disconnects += 1
+                outcome = "disconnected"
+                raise
             
             except Exception as e:
                 logger.error(f"❌ File streamer failed: {e}")
+                outcome = "error"
+            
+            finally:
+                finish()
+                
+                access_log.log({
+                    "kind": "stream",
+                    "token": token_data.get("token"),
+                    "ip_address": client_ip(request),
+                    "status": status_code,
+                    "bytes": served,
+                    "first_byte_ms": round((first_byte_at - started) * 1000, 2) if first_byte_at else None,
+                    "duration_ms": round((time.monotonic() - started) * 1000, 2),
+                    "outcome": outcome,
+                    "success": outcome != "error"
+                })
         
-        # Determine content type
-        content_type = "video/mp4"  # Default
-        
-        # Build headers
-        headers = {
-            "Accept-Ranges": "bytes",
-            "Content-Length": str(end - start + 1),
-            "Content-Type": content_type,
-        }
-        
-        if range_header:
-            headers["Content-Range"] = f"bytes {start}-{end}/{file_size}"
-            status_code = 206  # Partial Content
-        else:
-            status_code = 200
+        streaming = True
         
-        return StreamingResponse(
+        return BlockStreamingResponse(
             file_streamer(),
             status_code=status_code,
             headers=headers,
-            media_type=content_type
+            background=BackgroundTask(finish)
         )
     
+    except StreamUnavailable:
+        raise
+    
     except Exception as e:
         logger.error(f"❌ Stream file failed BC: {e}")
         raise
+    
+    finally:
+        # 304/416/HEAD answers and failures don't keep the connection lease
+        if lease and not streaming:
+            lease.release()
+
+async def stream_stats() -> dict:
+    """Stream counters of this worker, plus the fetcher daemon's when there is one"""
+    stats = stream_metrics.snapshot()
+    stats["access_log"] = access_log.stats()
+    
+    if isinstance(block_source, FetcherClient):
+        try:
+            stats["fetcher"] = await block_source.stats()
+        except Exception as e:
+            logger.warning(f"⚠️ Fetcher stats unavailable: {e}")
+    
+    return stats
 
 async def cleanup_stream_client():
-    """Cleanup stream client"""
-    global stream_client
+    """Cleanup stream clients"""
+    global block_source
     
-    if stream_client:
+    if block_source:
         try:
-            await stream_client.stop()
+            await block_source.close()
             logger.info("🛑 Stream client stopped")
         except:
             pass
+        
+        block_source = None
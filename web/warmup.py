@@ -0,0 +1,84 @@
+import asyncio
+import logging
+import time
+from config import Config
+from web.blocks import BLOCK_SIZE, block_count
+from web.disk_cache import disk_cache
+
+logger = logging.getLogger(__name__)
+
+IDLE_POLL_INTERVAL = 0.25  # seconds between checks for a quiet pool
+
+def warmup_indexes(file_size: int) -> list:
+    """Blocks worth having before the first viewer: the head, and the tail where moov often lives"""
+    count = block_count(file_size)
+    head = min(count, -(-Config.STREAM_WARMUP_HEAD_BYTES // BLOCK_SIZE))
+    tail = min(count, -(-Config.STREAM_WARMUP_TAIL_BYTES // BLOCK_SIZE))
+    
+    return sorted(set(range(head)) | set(range(count - tail, count)))
+
+class WarmupLane:
+    """
+    Low-priority background fetches that fill the disk cache for new uploads
+    One job at a time, one block at a time, and only while no live fetch is
+    running, so viewers never queue behind a warm-up
+    """
+    
+    def __init__(self):
+        self.queue = asyncio.Queue(maxsize=Config.STREAM_WARMUP_QUEUE)
+        self.task = None
+    
+    def start(self, source):
+        if self.task is None:
+            self.task = asyncio.create_task(self._run(source))
+    
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            self.task = None
+    
+    def enqueue(self, file_doc: dict, file_size: int) -> bool:
+        """Queue a file for warm-up; False when the lane is off or full"""
+        if self.task is None:
+            return False
+        
+        try:
+            self.queue.put_nowait((file_doc, file_size, time.monotonic()))
+            return True
+        except asyncio.QueueFull:
+            logger.warning(f"⚠️ Warm-up queue full, skipping {file_doc['file_unique_id']}")
+            return False
+    
+    async def _run(self, source):
+        while True:
+            file_doc, file_size, queued_at = await self.queue.get()
+            
+            try:
+                await self._warm(source, file_doc, file_size, queued_at + Config.STREAM_WARMUP_MAX_DELAY)
+            except Exception as e:
+                logger.error(f"❌ Warm-up failed for {file_doc['file_unique_id']}: {e}")
+    
+    async def _warm(self, source, file_doc: dict, file_size: int, deadline: float):
+        unique_id = file_doc["file_unique_id"]
+        warmed = 0
+        
+        for index in warmup_indexes(file_size):
+            if disk_cache.has(unique_id, index):
+                continue
+            
+            # Live traffic goes first; a job that can't get a quiet moment in time is dropped
+            while not source.pool.idle():
+                if time.monotonic() > deadline:
+                    logger.info(f"⚠️ Warm-up of {unique_id} gave up, pool never went idle")
+                    return
+                
+                await asyncio.sleep(IDLE_POLL_INTERVAL)
+            
+            await source.load_block(file_doc, file_size, index)
+            warmed += 1
+        
+        if warmed:
+            logger.info(f"🔥 Warmed {warmed} blocks of {unique_id}")
+
+# Global warm-up lane instance
+warmup_lane = WarmupLane()
@@ -0,0 +1,148 @@
+import asyncio
+import fcntl
+import hashlib
+import logging
+import os
+from contextlib import asynccontextmanager
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# Lock files under WEB_RUNTIME_DIR coordinate the uvicorn worker processes.
+# flock locks die with the process, so a crashed worker never leaks a slot.
+
+worker_id = None
+_worker_fd = None
+
+def _lock_path(*parts: str) -> str:
+    path = os.path.join(Config.WEB_RUNTIME_DIR, *parts)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
+
+def _try_lock(fd: int) -> bool:
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except BlockingIOError:
+        return False
+
+def claim_worker_id() -> int:
+    """Claim the lowest free worker number for this process"""
+    global worker_id, _worker_fd
+    
+    if worker_id is not None:
+        return worker_id
+    
+    i = 0
+    
+    while True:
+        fd = os.open(_lock_path("workers", f"{i}.lock"), os.O_RDWR | os.O_CREAT)
+        
+        if _try_lock(fd):
+            worker_id, _worker_fd = i, fd
+            logger.info(f"✅ Web worker {worker_id} (pid {os.getpid()}) registered")
+            return worker_id
+        
+        os.close(fd)
+        i += 1
+
+@asynccontextmanager
+async def startup_lock():
+    """Let one worker at a time log its Telegram sessions in"""
+    fd = os.open(_lock_path("startup.lock"), os.O_RDWR | os.O_CREAT)
+    
+    try:
+        await asyncio.to_thread(fcntl.flock, fd, fcntl.LOCK_EX)
+        yield
+        
+        # Give Telegram a breather before the next worker logs in
+        await asyncio.sleep(Config.STREAM_LOGIN_DELAY)
+    
+    finally:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+class ConnectionSlots:
+    """
+    Connection cap shared by every worker on the machine
+    Each slot is a lock file; a response holds one slot for as long as it streams
+    """
+    
+    def __init__(self):
+        self.limit = Config.WEB_MAX_CONNECTIONS
+        self.fds = {}
+        self.held = set()
+    
+    def acquire(self):
+        """Take a free slot, or None when the cap is reached (0 means no cap)"""
+        if self.limit <= 0:
+            return -1
+        
+        for slot in range(self.limit):
+            if slot in self.held:
+                continue
+            
+            fd = self.fds.get(slot)
+            
+            if fd is None:
+                fd = os.open(_lock_path("slots", f"{slot}.lock"), os.O_RDWR | os.O_CREAT)
+                self.fds[slot] = fd
+            
+            if _try_lock(fd):
+                self.held.add(slot)
+                return slot
+        
+        return None
+    
+    def release(self, slot: int):
+        """Give a slot back (safe to call twice)"""
+        if slot is None or slot not in self.held:
+            return
+        
+        self.held.discard(slot)
+        fcntl.flock(self.fds[slot], fcntl.LOCK_UN)
+
+def take_slot(key: str, limit: int):
+    """
+    Lock one of limit slots for key, shared by every worker on the machine
+    Returns a handle for free_slot, or None when every slot is held
+    """
+    name = hashlib.blake2b(key.encode(), digest_size=8).hexdigest()
+    
+    for slot in range(limit):
+        path = _lock_path("conn", f"{name}-{slot}.lock")
+        
+        while True:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT)
+            
+            if not _try_lock(fd):
+                os.close(fd)
+                break
+            
+            # free_slot may have unlinked the file between our open and lock; a lock
+            # on the unlinked copy guards nothing, so try again on the fresh file
+            try:
+                current = os.stat(path).st_ino == os.fstat(fd).st_ino
+            except FileNotFoundError:
+                current = False
+            
+            if current:
+                return fd, path
+            
+            os.close(fd)
+    
+    return None
+
+def free_slot(handle: tuple):
+    """Give back a slot from take_slot; the file goes too, so idle keys leave nothing behind"""
+    fd, path = handle
+    
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+    
+    os.close(fd)
+
+# Global connection slots instance
+connection_slots = ConnectionSlots()